@@ -0,0 +1,27 @@
+# Read by gunicorn from the directory it is started in (the repo root, see Procfile and render.yaml).
+import os
+import shutil
+import tempfile
+
+# con varios hilos por worker una peticion que espera (base de datos, hash de
+# un password en passwords.py) no bloquea al resto
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+# cada worker escribe sus metricas aqui y /metrics las suma (ver src/metrics.py)
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "api-consultas-metrics")
+
+# prometheus_client elige el modo al importarse y los workers heredan el import del master:
+# tiene que ver ya la variable
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # las metricas de una ejecucion anterior no cuentan
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
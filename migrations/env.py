@@ -45,6 +45,23 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# search objects created with raw SQL by the search index migrations; the
+# models do not declare them, so autogenerate would drop them
+SEARCH_TABLES = ('patient_fts', 'record_fts')  # and their fts5 shadow tables
+SEARCH_INDEXES = {'ix_patient_search_trgm', 'ix_record_search_vector'}
+SEARCH_COLUMNS = {('record', 'search_vector')}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and name.startswith(SEARCH_TABLES):
+        return False
+    if type_ == 'index' and name in SEARCH_INDEXES:
+        return False
+    if type_ == 'column' and (object.table.name, name) in SEARCH_COLUMNS:
+        return False
+    return True
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -65,7 +82,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,10 +111,19 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # batch mode recreates sqlite tables: with foreign keys on, dropping
+        # the old table would cascade-delete the rows that reference it.
+        # The pragma only takes effect outside a transaction.
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -106,6 +133,10 @@ def run_migrations_online():
         with context.begin_transaction():
             context.run_migrations()
 
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+            connection.commit()
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,39 @@
+"""add query path indexes
+
+Revision ID: 4a9fe52e16fb
+Revises: 8d078ee78a29
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a9fe52e16fb'
+down_revision = '8d078ee78a29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (id_patient, date) also serves lookups on id_patient alone
+    with op.batch_alter_table('record', schema=None) as batch_op:
+        batch_op.create_index('ix_record_id_patient_date', ['id_patient', 'date'], unique=False)
+
+    with op.batch_alter_table('record__obst', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_record__obst_id_record'), ['id_record'], unique=False)
+
+    with op.batch_alter_table('pay', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pay_id_record'), ['id_record'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pay', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pay_id_record'))
+
+    with op.batch_alter_table('record__obst', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_record__obst_id_record'))
+
+    with op.batch_alter_table('record', schema=None) as batch_op:
+        batch_op.drop_index('ix_record_id_patient_date')
@@ -0,0 +1,67 @@
+"""add patient search index
+
+Revision ID: 4b3a4ecba3f0
+Revises: 4a9fe52e16fb
+Create Date: 2026-10-18 10:03:17.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b3a4ecba3f0'
+down_revision = '4a9fe52e16fb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # external content FTS5 table over patient, kept in sync by triggers
+        op.execute("""
+            CREATE VIRTUAL TABLE patient_fts USING fts5(
+                name, last_name, dni,
+                content='patient', content_rowid='id', tokenize='trigram'
+            )
+        """)
+        op.execute("INSERT INTO patient_fts(patient_fts) VALUES ('rebuild')")
+        op.execute("""
+            CREATE TRIGGER patient_fts_ai AFTER INSERT ON patient BEGIN
+                INSERT INTO patient_fts(rowid, name, last_name, dni)
+                VALUES (new.id, new.name, new.last_name, new.dni);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER patient_fts_ad AFTER DELETE ON patient BEGIN
+                INSERT INTO patient_fts(patient_fts, rowid, name, last_name, dni)
+                VALUES ('delete', old.id, old.name, old.last_name, old.dni);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER patient_fts_au AFTER UPDATE ON patient BEGIN
+                INSERT INTO patient_fts(patient_fts, rowid, name, last_name, dni)
+                VALUES ('delete', old.id, old.name, old.last_name, old.dni);
+                INSERT INTO patient_fts(rowid, name, last_name, dni)
+                VALUES (new.id, new.name, new.last_name, new.dni);
+            END
+        """)
+    elif dialect == 'postgresql':
+        # the indexed expression must match search.PATIENT_SEARCH_EXPRESSION
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("""
+            CREATE INDEX ix_patient_search_trgm ON patient
+            USING gin ((name || ' ' || last_name || ' ' || dni) gin_trgm_ops)
+        """)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS patient_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS patient_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS patient_fts_ai")
+        op.execute("DROP TABLE IF EXISTS patient_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_patient_search_trgm")
@@ -0,0 +1,32 @@
+"""add updated_at
+
+Revision ID: 7fd09a426546
+Revises: dca70ab1aaa9
+Create Date: 2026-10-18 12:40:55.120364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7fd09a426546'
+down_revision = 'dca70ab1aaa9'
+branch_labels = None
+depends_on = None
+
+TABLES = ['patient', 'record', 'record__obst', 'pay']
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # existing rows count as modified now
+        op.execute("UPDATE %s SET updated_at = CURRENT_TIMESTAMP" % table)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
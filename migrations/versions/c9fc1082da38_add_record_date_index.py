@@ -0,0 +1,27 @@
+"""add record date index
+
+Revision ID: c9fc1082da38
+Revises: 7fd09a426546
+Create Date: 2026-10-18 13:52:08.671530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9fc1082da38'
+down_revision = '7fd09a426546'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # date range filters of the payment reports
+    with op.batch_alter_table('record', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_record_date'), ['date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('record', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_record_date'))
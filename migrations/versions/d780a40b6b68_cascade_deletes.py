@@ -0,0 +1,65 @@
+"""cascade deletes
+
+Revision ID: d780a40b6b68
+Revises: ee50cb9715e2
+Create Date: 2026-10-18 17:12:40.318206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd780a40b6b68'
+down_revision = 'ee50cb9715e2'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table)
+FOREIGN_KEYS = [
+    ('record', 'id_patient', 'patient'),
+    ('record__obst', 'id_record', 'record'),
+    ('pay', 'id_record', 'record'),
+]
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def convention_name(table, column, referred):
+    return NAMING_CONVENTION['fk'] % {'table_name': table, 'column_0_name': column, 'referred_table_name': referred}
+
+
+def foreign_key_name(table, column, referred):
+    # postgres / mysql gave the original constraints their own names,
+    # sqlite leaves them unnamed and batch mode names them by the convention
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if foreign_key['constrained_columns'] == [column] and foreign_key['name']:
+            return foreign_key['name']
+    return convention_name(table, column, referred)
+
+
+def replace_foreign_keys(ondelete):
+    bind = op.get_bind()
+    triggers = []
+    if bind.dialect.name == 'sqlite':
+        # batch mode recreates the tables and that drops their triggers
+        # (the record_fts ones of the search index), they are created again after
+        triggers = bind.execute(sa.text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('record', 'record__obst', 'pay')"
+        )).scalars().all()
+
+    for table, column, referred in FOREIGN_KEYS:
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(foreign_key_name(table, column, referred), type_='foreignkey')
+            batch_op.create_foreign_key(convention_name(table, column, referred), referred, [column], ['id'],
+                                        ondelete=ondelete)
+
+    for sql in triggers:
+        op.execute(sql)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
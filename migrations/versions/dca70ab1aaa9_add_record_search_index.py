@@ -0,0 +1,72 @@
+"""add record search index
+
+Revision ID: dca70ab1aaa9
+Revises: 4b3a4ecba3f0
+Create Date: 2026-10-18 11:26:02.904471
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dca70ab1aaa9'
+down_revision = '4b3a4ecba3f0'
+branch_labels = None
+depends_on = None
+
+# must match search.RECORD_SEARCH_COLUMNS
+COLUMNS = ['diagnosis', 'recommendations', 'treatment', 'diagnosis_diff', 'diagnosis_eco', 'exams',
+           'medications', 'symtomps', 'phy_exa', 'signs', 'type_pat', 'observations']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    columns = ', '.join(COLUMNS)
+    new_values = ', '.join('new.' + column for column in COLUMNS)
+    old_values = ', '.join('old.' + column for column in COLUMNS)
+    if dialect == 'sqlite':
+        # external content FTS5 table over record, kept in sync by triggers
+        op.execute("""
+            CREATE VIRTUAL TABLE record_fts USING fts5(
+                %s,
+                content='record', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """ % columns)
+        op.execute("INSERT INTO record_fts(record_fts) VALUES ('rebuild')")
+        op.execute("""
+            CREATE TRIGGER record_fts_ai AFTER INSERT ON record BEGIN
+                INSERT INTO record_fts(rowid, %s) VALUES (new.id, %s);
+            END
+        """ % (columns, new_values))
+        op.execute("""
+            CREATE TRIGGER record_fts_ad AFTER DELETE ON record BEGIN
+                INSERT INTO record_fts(record_fts, rowid, %s) VALUES ('delete', old.id, %s);
+            END
+        """ % (columns, old_values))
+        op.execute("""
+            CREATE TRIGGER record_fts_au AFTER UPDATE ON record BEGIN
+                INSERT INTO record_fts(record_fts, rowid, %s) VALUES ('delete', old.id, %s);
+                INSERT INTO record_fts(rowid, %s) VALUES (new.id, %s);
+            END
+        """ % (columns, old_values, columns, new_values))
+    elif dialect == 'postgresql':
+        # stored generated column, postgres keeps it up to date on every write
+        document = " || ' ' || ".join("coalesce(%s, '')" % column for column in COLUMNS)
+        op.execute("""
+            ALTER TABLE record ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', %s)) STORED
+        """ % document)
+        op.execute("CREATE INDEX ix_record_search_vector ON record USING gin (search_vector)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS record_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS record_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS record_fts_ai")
+        op.execute("DROP TABLE IF EXISTS record_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_record_search_vector")
+        op.execute("ALTER TABLE record DROP COLUMN IF EXISTS search_vector")
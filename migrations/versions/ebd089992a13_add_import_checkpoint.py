@@ -0,0 +1,33 @@
+"""add import checkpoint
+
+Revision ID: ebd089992a13
+Revises: d780a40b6b68
+Create Date: 2026-10-18 19:05:12.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ebd089992a13'
+down_revision = 'd780a40b6b68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_checkpoint',
+    sa.Column('name', sa.String(length=500), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('created', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('pays', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoint')
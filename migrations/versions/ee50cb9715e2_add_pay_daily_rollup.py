@@ -0,0 +1,42 @@
+"""add pay daily rollup
+
+Revision ID: ee50cb9715e2
+Revises: c9fc1082da38
+Create Date: 2026-10-18 14:37:21.804512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ee50cb9715e2'
+down_revision = 'c9fc1082da38'
+branch_labels = None
+depends_on = None
+
+# must match reports.PAY_METHODS
+METHODS = ['pesos', 'cash', 'pay_mov', 'biopago', 'point']
+
+
+def upgrade():
+    op.create_table('pay_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('method', sa.String(length=20), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'method')
+    )
+    # backfill from the existing payments, same as `flask rollup rebuild`
+    for method in METHODS:
+        op.execute("""
+            INSERT INTO pay_daily (day, method, total, count)
+            SELECT record.date, '{0}', SUM(pay.{0}), SUM(CASE WHEN pay.{0} != 0 THEN 1 ELSE 0 END)
+            FROM pay JOIN record ON record.id = pay.id_record
+            GROUP BY record.date
+            HAVING SUM(CASE WHEN pay.{0} != 0 THEN 1 ELSE 0 END) > 0
+        """.format(method))
+
+
+def downgrade():
+    op.drop_table('pay_daily')
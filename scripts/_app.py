@@ -0,0 +1,62 @@
+"""
+Helpers to run the API against a throwaway database from the scripts in this folder
+"""
+import datetime
+import os
+import secrets
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations")
+
+
+def load_app(database_url=None):
+    """Imports src/app.py bound to database_url (a new temporary SQLite file by default)
+    and runs every migration on it, so the schema and indexes match production."""
+    if database_url is None:
+        fd, path = tempfile.mkstemp(prefix="api-consultas-", suffix=".db")
+        os.close(fd)
+        os.unlink(path)
+        database_url = "sqlite:///" + path
+    # app.py lee DATABASE_URL al importarse
+    os.environ["DATABASE_URL"] = database_url
+    # una clave cualquiera para los tokens de una base de usar y tirar
+    os.environ.setdefault("JWT_SECRET_KEY", secrets.token_hex(32))
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+    import app
+    from flask_migrate import upgrade
+
+    with app.api.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+    return app
+
+
+def seed(patients=200, records=5):
+    """Adds patients with their records, pays and obstetric records, and as many users.
+    Call it inside an app context, after load_app()."""
+    from models import db, Patient, Record, Record_Obst, Pay, User
+
+    for i in range(patients):
+        db.session.add(User(username="user%d" % i, password="x", is_active=True))
+    for i in range(patients):
+        patient = Patient(name="Name %d" % i, last_name="Last %d" % i, dni="P%07d" % i,
+                          parish="parish", city="city", mun="mun", gender="F", number="0",
+                          ant_fam="ant fam", ant_per="ant per")
+        db.session.add(patient)
+        db.session.flush()
+        for j in range(records):
+            record = Record(diagnosis="diagnosis", recommendations="recommendations", treatment="treatment",
+                            date=datetime.date(2024, 1, 1) + datetime.timedelta(days=j),
+                            diagnosis_diff="diff", diagnosis_eco="eco", exams="exams",
+                            medications="medications", symtomps="symtomps", phy_exa="phy_exa",
+                            signs="signs", type_pat="general", observations="observations",
+                            id_patient=patient.id)
+            db.session.add(record)
+            db.session.flush()
+            db.session.add(Pay(pesos=1, cash=1, pay_mov=1, biopago=1, point=1, id_record=record.id))
+            db.session.add(Record_Obst(num_births=0, num_abort=0, menst_date=datetime.date(2024, 1, 1),
+                                       type_preg="none", id_record=record.id))
+    db.session.commit()
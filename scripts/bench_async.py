@@ -0,0 +1,118 @@
+"""
+Concurrency of the sync deployment (gunicorn + wsgi.py) against the async one
+(uvicorn + asgi.py) with the same number of worker processes, on a mix of the
+CRUD routes that asgi.py serves asynchronously.
+
+    $ python scripts/bench_async.py --database-url postgresql://localhost/bench --workers 2
+    $ python scripts/bench_async.py --concurrency 1,16,64,256 --requests 2000
+
+The async mode pays off when requests wait on the network for the database,
+so run it against Postgres for meaningful numbers; with the default local
+SQLite file both modes spend their time in Python. --database-url must point
+at a scratch database, the script seeds it and writes pays to it.
+"""
+import argparse
+import os
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _app import load_app, SRC_DIR
+from bench_endpoints import HTTPTransport, percentile, prepare, start_gunicorn
+from check_query_budget import PAY
+
+
+def start_uvicorn(database_url, port, workers):
+    env = dict(os.environ, DATABASE_URL=database_url, PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp())
+    process = subprocess.Popen(["uvicorn", "asgi:application", "--app-dir", SRC_DIR, "--host", "127.0.0.1",
+                                "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+                                "--no-access-log"], env=env)
+    transport = HTTPTransport(port)
+    for i in range(100):
+        if transport.send("GET", "/user", None)[0] == 200:
+            return process
+        transport.local.connection = None
+        time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("uvicorn did not start on port %d" % port)
+
+
+def request_mix(ranges, requests, seed):
+    # sobre todo lecturas, como el uso real: fichas, historias y pagos
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(requests):
+        roll = rng.random()
+        if roll < 0.3:
+            jobs.append(("GET", "/patient/%d" % rng.randint(*ranges["patient"]), None))
+        elif roll < 0.55:
+            jobs.append(("GET", "/record/patient/%d" % rng.randint(*ranges["patient"]), None))
+        elif roll < 0.75:
+            jobs.append(("GET", "/record/%d" % rng.randint(*ranges["record"]), None))
+        elif roll < 0.9:
+            jobs.append(("GET", "/pay/record/%d" % rng.randint(*ranges["record"]), None))
+        else:
+            jobs.append(("POST", "/pay/%d/" % rng.randint(*ranges["record"]), PAY))
+    return jobs
+
+
+def run(transport, jobs, concurrency):
+    latencies, errors = [], 0
+
+    def call(job):
+        start = time.perf_counter()
+        status, body = transport.send(*job)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed, status in executor.map(call, jobs):
+            latencies.append(elapsed)
+            errors += status >= 400
+    elapsed = time.perf_counter() - start
+    return len(jobs) / elapsed, percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="scratch database (default: SQLite in the temp folder)")
+    parser.add_argument("--records", type=int, default=10000, help="records to seed")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for both servers")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma separated client counts")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per concurrency level")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.gettempdir(),
+                                                                    "api-consultas-bench-%d.db" % args.records)
+    app = load_app(database_url)
+    ranges, dialect = prepare(app, args.records, 0)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    servers = [("sync", start_gunicorn), ("async", start_uvicorn)]
+    results = {}
+    for name, start in servers:
+        server = start(database_url, args.port, args.workers)
+        try:
+            transport = HTTPTransport(args.port)
+            # calienta conexiones y caches antes de medir
+            run(transport, request_mix(ranges, 200, 1), 8)
+            for level in levels:
+                transport = HTTPTransport(args.port)
+                results[name, level] = run(transport, request_mix(ranges, args.requests, level), level)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print("%s, %d workers per server" % (dialect, args.workers))
+    print("%-8s %-6s %9s %9s %9s %7s" % ("clients", "mode", "req/s", "p50 ms", "p95 ms", "errors"))
+    for level in levels:
+        for name, start in servers:
+            rps, p50, p95, errors = results[name, level]
+            print("%-8d %-6s %9.1f %9.2f %9.2f %7d" % (level, name, rps, p50, p95, errors))
+
+
+if __name__ == "__main__":
+    main()
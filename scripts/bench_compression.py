@@ -0,0 +1,77 @@
+"""
+CPU cost of compressing the API responses at every gzip and brotli level,
+with the compressors of src/compression.py, on real response bodies taken
+from a seeded temporary SQLite database.
+
+    $ python scripts/bench_compression.py
+    $ python scripts/bench_compression.py --records 5000 --min-time 0.5
+
+For each body it prints the compressed size ratio and the CPU time per MB of
+uncompressed input. The export is compressed in chunks of EXPORT_BATCH_SIZE
+rows with a flush after each one, the way the streamed response is sent.
+"""
+import argparse
+import time
+
+from _app import load_app
+from bench_endpoints import prepare
+
+BODIES = [
+    ("records page", "/records?fields=all&limit=500"),
+    ("records summary", "/records?limit=500"),
+    ("patients page", "/patients?fields=all&limit=500"),
+    ("pays page", "/pays?limit=500"),
+]
+LEVELS = {"gzip": range(1, 10), "br": range(0, 12)}
+
+
+def export_chunks(client, batch_size):
+    # las mismas lineas que el export, agrupadas como los lotes de yield_per
+    lines = client.get("/export/records.ndjson").get_data().splitlines(keepends=True)
+    return [b"".join(lines[i:i + batch_size]) for i in range(0, len(lines), batch_size)]
+
+
+def cpu_time(function, min_time):
+    # tiempo de CPU por llamada, repitiendo hasta min_time segundos
+    calls, start = 0, time.process_time()
+    while True:
+        output = function()
+        calls += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            return elapsed / calls, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000, help="records to seed")
+    parser.add_argument("--min-time", type=float, default=0.2, help="CPU seconds per measure")
+    args = parser.parse_args()
+
+    app = load_app()
+    prepare(app, args.records, 0)
+    from app import EXPORT_BATCH_SIZE
+    from compression import COMPRESSORS, compress, compress_stream
+
+    client = app.api.test_client()
+    bodies = [(name, [client.get(path).get_data()]) for name, path in BODIES]
+    bodies.append(("records export", export_chunks(client, EXPORT_BATCH_SIZE)))
+
+    print("%-16s %-5s %5s %10s %10s %8s %10s" % ("body", "codec", "level", "size KB", "out KB", "ratio", "ms CPU/MB"))
+    for name, chunks in bodies:
+        size = sum(len(chunk) for chunk in chunks)
+        for encoding in COMPRESSORS:
+            for level in LEVELS[encoding]:
+                if len(chunks) == 1:
+                    seconds, output = cpu_time(lambda: compress(chunks[0], encoding, level), args.min_time)
+                else:
+                    seconds, output = cpu_time(lambda: b"".join(compress_stream(chunks, encoding, level)),
+                                               args.min_time)
+                print("%-16s %-5s %5d %10.1f %10.1f %7.1fx %10.2f" % (name, encoding, level, size / 1024,
+                                                                      len(output) / 1024, size / len(output),
+                                                                      seconds * 1000 / (size / 1048576)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Throughput of POST /patient with concurrent writers against gunicorn, and a
+race check: several clients create the same dni at the same instant and only
+one of them may get a 201.
+
+    $ python scripts/bench_creates.py --concurrency 1,8,32 --requests 2000
+    $ python scripts/bench_creates.py --database-url postgresql://localhost/bench --workers 4
+
+--database-url must point at a scratch database, the script adds patients to
+it. With the default SQLite file every insert waits for the single writer
+lock, so run it against Postgres for numbers that mean something.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from _app import load_app
+from bench_endpoints import HTTPTransport, percentile, start_gunicorn
+from check_query_budget import PATIENT
+
+
+def patient(dni):
+    return dict(PATIENT, dni=dni)
+
+
+def run_creates(transport, prefix, requests, concurrency):
+    latencies, statuses = [], {}
+
+    def call(index):
+        start = time.perf_counter()
+        status, body = transport.send("POST", "/patient", patient("%s%06d" % (prefix, index)))
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed, status in executor.map(call, range(requests)):
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, statuses
+
+
+def run_race(transport, prefix, rounds, concurrency):
+    # todos los clientes esperan en la barrera y mandan el mismo dni a la vez
+    barrier = threading.Barrier(concurrency)
+    duplicates, statuses = 0, {}
+
+    def call(dni):
+        barrier.wait()
+        return transport.send("POST", "/patient", patient(dni))[0]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for round in range(rounds):
+            dni = "%s%06d" % (prefix, round)
+            results = list(executor.map(call, [dni] * concurrency))
+            for status in results:
+                statuses[status] = statuses.get(status, 0) + 1
+            duplicates += max(0, results.count(201) - 1)
+    return duplicates, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="scratch database (default: a new SQLite file)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated writer counts")
+    parser.add_argument("--requests", type=int, default=1000, help="creates per concurrency level")
+    parser.add_argument("--rounds", type=int, default=50, help="rounds of the same-dni race")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="api-consultas-creates-"), "bench.db")
+    load_app(database_url)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    # dni de 15 caracteres como maximo, distintos en cada ejecucion
+    run = uuid.uuid4().hex[:6]
+
+    server = start_gunicorn(database_url, args.port, args.workers)
+    try:
+        print("%d gunicorn workers" % args.workers)
+        print("%-8s %9s %9s %9s  %s" % ("writers", "creates/s", "p50 ms", "p95 ms", "statuses"))
+        for level in levels:
+            transport = HTTPTransport(args.port)
+            rps, p50, p95, statuses = run_creates(transport, "C%s%02d" % (run, level), args.requests, level)
+            print("%-8d %9.1f %9.2f %9.2f  %s" % (level, rps, p50, p95, statuses))
+
+        race_clients = max(levels)
+        duplicates, statuses = run_race(HTTPTransport(args.port), "R%s" % run, args.rounds, race_clients)
+        print("race: %d rounds of %d clients with the same dni, %d duplicate creates, statuses %s"
+              % (args.rounds, race_clients, duplicates, statuses))
+    finally:
+        server.terminate()
+        server.wait()
+    if duplicates:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
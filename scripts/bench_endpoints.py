@@ -0,0 +1,328 @@
+"""
+Throughput and latency of every endpoint against a seeded database, compared
+with a stored baseline so a change to app.py or models.py that makes an
+endpoint slower is flagged.
+
+    $ pipenv run bench --scale 10k                        # Flask test client, in process
+    $ pipenv run bench --scale 100k --http --concurrency 16 --workers 2   # gunicorn + concurrent clients
+    $ pipenv run bench --scale 10k --save-baseline        # store the results as the new baseline
+    $ pipenv run bench --scale 1m --database-url postgresql://localhost/bench
+
+The SQLite database for each scale is kept in the temp folder and reused by
+the next run; --database-url must point at a scratch database. Results are
+compared with the baseline entry for the same mode, database and scale, and
+the script exits 1 when an endpoint's p95 grows or its requests per second
+drop by more than --tolerance.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _app import load_app, SRC_DIR
+from check_query_budget import PATIENT, RECORD, OBSTETRIC, PAY
+
+SCALES = {"10k": 10000, "100k": 100000, "1m": 1000000}
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+ROOT_DIR = os.path.join(SRC_DIR, "..")
+
+# nombre, metodo, ruta, cuerpo y opciones:
+#   creates   guarda los ids que devuelve en esa lista, para borrarlos despues
+#   uses      toma (y consume) un id de esa lista como {created}
+#   dates     manda fechas como texto, que SQLite no acepta
+#   share     fraccion de --requests para los endpoints pesados
+ROUTES = [
+    ("hello", "GET", "/user", None, {}),
+    ("login", "POST", "/login", {"user": "bench", "password": "bench"}, {"share": 0.1}),
+    ("users", "GET", "/users", None, {}),
+    ("user", "GET", "/user/{user}", None, {}),
+    ("create user", "POST", "/user", {"username": "bench{unique}", "password": "bench"},
+     {"creates": "users", "share": 0.1}),
+    ("edit user", "PUT", "/user/{created}", {"username": "edited{unique}"}, {"uses": "users", "keep": True}),
+    ("delete user", "DELETE", "/user/{created}", None, {"uses": "users"}),
+    ("patients", "GET", "/patients", None, {}),
+    ("patients page", "GET", "/patients?after={cursor}&limit=50", None, {}),
+    ("patient", "GET", "/patient/{patient}", None, {}),
+    ("patient chart", "GET", "/patient/{patient}?include=records,records.pay,records.obstetric", None, {}),
+    ("patient search", "GET", "/patients/search?q=Mar", None, {}),
+    ("create patient", "POST", "/patient", dict(PATIENT, dni="B{unique}"), {"creates": "patients"}),
+    ("edit patient", "PUT", "/patient/{created}", dict(PATIENT, dni="B{unique}"), {"uses": "patients", "keep": True}),
+    ("records", "GET", "/records", None, {}),
+    ("record", "GET", "/record/{record}", None, {}),
+    ("record search", "GET", "/records/search?q=fiebre&from=2023-06-01&to=2023-06-30", None, {}),
+    ("patient records", "GET", "/record/patient/{patient}", None, {}),
+    ("create record", "POST", "/record/{created}/", dict(RECORD, type_pat="general"),
+     {"uses": "patients", "keep": True, "creates": "records", "dates": True}),
+    ("edit record", "PUT", "/record/{created}", RECORD, {"uses": "records", "keep": True, "dates": True}),
+    ("obstetric records", "GET", "/records/obstetric", None, {}),
+    ("obstetric record", "GET", "/record/obstetric/{obstetric}", None, {}),
+    ("create obstetric", "POST", "/record/obstetric/{created}/", OBSTETRIC,
+     {"uses": "records", "keep": True, "creates": "obstetric", "dates": True}),
+    ("edit obstetric", "PUT", "/record/obstetric/{created}", OBSTETRIC, {"uses": "obstetric", "keep": True, "dates": True}),
+    ("delete obstetric", "DELETE", "/record/obstetric/{created}", None, {"uses": "obstetric", "dates": True}),
+    ("pays", "GET", "/pays", None, {}),
+    ("pay", "GET", "/pay/{pay}", None, {}),
+    ("record pays", "GET", "/pay/record/{record}", None, {}),
+    ("pay summary", "GET", "/pays/summary?from=2023-01-01&to=2023-12-31&group=month", None, {}),
+    ("create pay", "POST", "/pay/{record}/", PAY, {"creates": "pays"}),
+    ("edit pay", "PUT", "/pay/{created}", PAY, {"uses": "pays", "keep": True}),
+    ("delete pay", "DELETE", "/pay/{created}", None, {"uses": "pays"}),
+    ("delete record", "DELETE", "/record/{created}", None, {"uses": "records", "dates": True}),
+    ("delete patient", "DELETE", "/patient/{created}", None, {"uses": "patients"}),
+    ("bulk pays", "POST", "/pays/bulk", [dict(PAY, id_record="{record}")] * 100, {"share": 0.1}),
+    ("export patients", "GET", "/export/patients.ndjson", None, {"share": 0.02}),
+    ("pool stats", "GET", "/pool/stats", None, {}),
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+
+def fill(value, params):
+    # rellena los {marcadores} de la ruta y del cuerpo
+    if isinstance(value, str):
+        # "{record}" solo, dentro de un cuerpo JSON, va como numero
+        if value.startswith("{") and value.endswith("}") and value[1:-1] in params:
+            return params[value[1:-1]]
+        return value.format(**params)
+    if isinstance(value, dict):
+        return {key: fill(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, params) for item in value]
+    return value
+
+
+class TestClientTransport:
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, method, path, body):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.api.test_client()
+        response = client.open(path, method=method, json=body)
+        data = response.get_data()
+        return response.status_code, data
+
+
+class HTTPTransport:
+
+    def __init__(self, port):
+        self.port = port
+        self.local = threading.local()
+
+    def send(self, method, path, body):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self.local.connection = None
+            return 599, b""
+
+
+def start_gunicorn(database_url, port, workers):
+    env = dict(os.environ, DATABASE_URL=database_url, PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp())
+    process = subprocess.Popen(["gunicorn", "wsgi", "--chdir", SRC_DIR, "-c", os.path.join(ROOT_DIR, "gunicorn.conf.py"),
+                                "-b", "127.0.0.1:%d" % port, "-w", str(workers), "--log-level", "warning"],
+                               env=env, cwd=ROOT_DIR)
+    for i in range(100):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/user")
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("gunicorn did not start on port %d" % port)
+
+
+def prepare(app, records, seed):
+    """Seeds the database up to `records` records and returns the id ranges to sample from"""
+    from models import db, User, Patient, Record, Record_Obst, Pay
+    from passwords import hash_password
+    from seed import seed_database
+    from utils import encode_cursor
+
+    with app.api.app_context():
+        existing = db.session.scalar(db.select(db.func.count(Record.id)))
+        if existing < records:
+            print("seeding %d records..." % (records - existing), flush=True)
+            start = time.perf_counter()
+            counts = seed_database(records - existing, seed=seed, workers=os.cpu_count() or 1)
+            print("seeded %s in %.1fs" % (counts, time.perf_counter() - start), flush=True)
+        if not db.session.scalar(db.select(User).where(User.username == "bench")):
+            db.session.add(User(username="bench", password=hash_password("bench"), is_active=True))
+            db.session.add_all(User(username="reader%d" % i, password="x", is_active=True) for i in range(100))
+            db.session.commit()
+
+        def id_range(model):
+            low, high = db.session.execute(db.select(db.func.min(model.id), db.func.max(model.id))).one()
+            return (low or 1, high or 1)
+
+        ranges = {"user": id_range(User), "patient": id_range(Patient), "record": id_range(Record),
+                  "obstetric": id_range(Record_Obst), "pay": id_range(Pay)}
+        ranges["cursor"] = [encode_cursor(i) for i in range(ranges["patient"][0], ranges["patient"][1], 50)][:1000]
+        return ranges, db.engine.dialect.name
+
+
+def run_route(transport, route, requests, concurrency, ranges, pools, rng_seed):
+    name, method, path, body, options = route
+    rng = random.Random(rng_seed)
+    pool = pools.setdefault(options.get("uses"), []) if options.get("uses") else None
+    created = pools.setdefault(options["creates"], []) if options.get("creates") else None
+    lock = threading.Lock()
+    jobs = []
+    for i in range(requests):
+        params = {key: rng.randint(*value) for key, value in ranges.items() if key != "cursor"}
+        params["cursor"] = rng.choice(ranges["cursor"]) if ranges["cursor"] else ""
+        params["unique"] = "%06d%07d" % (rng_seed % 10 ** 6, i)
+        if pool is not None:
+            if not pool:
+                break
+            params["created"] = pool[i % len(pool)] if options.get("keep") else pool.pop()
+        jobs.append((str(fill(path, params)), fill(body, params)))
+
+    latencies, errors = [], {}
+
+    def call(job):
+        start = time.perf_counter()
+        status, data = transport.send(method, *job)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+            elif created is not None:
+                try:
+                    answer = json.loads(data)
+                    answer = next(iter(answer.values())) if "id" not in answer else answer
+                    created.append(answer["id"])
+                except (ValueError, KeyError, TypeError, StopIteration, AttributeError):
+                    pass
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, jobs))
+    elapsed = time.perf_counter() - start
+    if not latencies:
+        return None
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50": round(percentile(latencies, 50) * 1000, 2),
+        "p95": round(percentile(latencies, 95) * 1000, 2),
+        "p99": round(percentile(latencies, 99) * 1000, 2),
+        "errors": errors,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints that got slower than the baseline, as (name, reason)"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not result:
+            continue
+        if result["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append((name, "p95 %.2fms -> %.2fms" % (before["p95"], result["p95"])))
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append((name, "rps %.1f -> %.1f" % (before["rps"], result["rps"])))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="10k", help="10k, 100k, 1m or a number of records")
+    parser.add_argument("--database-url", default=None, help="scratch database (default: SQLite in the temp folder)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=None, help="concurrent clients (default 1, or 8 with --http)")
+    parser.add_argument("--http", action="store_true", help="serve with gunicorn and send real HTTP requests")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers with --http")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--only", default=None, help="comma separated endpoint names to run")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the data and the request mix")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results in the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    records = SCALES.get(args.scale.lower()) or int(args.scale)
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.gettempdir(),
+                                                                    "api-consultas-bench-%d.db" % records)
+    concurrency = args.concurrency or (8 if args.http else 1)
+    app = load_app(database_url)
+    ranges, dialect = prepare(app, records, args.seed)
+
+    server = None
+    if args.http:
+        server = start_gunicorn(database_url, args.port, args.workers)
+        transport = HTTPTransport(args.port)
+    else:
+        transport = TestClientTransport(app)
+
+    only = set(args.only.split(",")) if args.only else None
+    results, pools = {}, {}
+    try:
+        print("%-20s %8s %9s %9s %9s %9s  %s" % ("endpoint", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+        for index, route in enumerate(ROUTES):
+            name, options = route[0], route[4]
+            if only and name not in only:
+                continue
+            if options.get("dates") and dialect == "sqlite":
+                continue
+            requests = max(5, int(args.requests * options.get("share", 1)))
+            result = run_route(transport, route, requests, concurrency, ranges, pools, args.seed * 1000 + index)
+            results[name] = result
+            if result is None:
+                print("%-20s %8s" % (name, "skipped"))
+                continue
+            print("%-20s %8d %9.1f %9.2f %9.2f %9.2f  %s" % (name, result["requests"], result["rps"], result["p50"],
+                                                              result["p95"], result["p99"], result["errors"] or ""))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    key = "%s:%s:%d:c%d" % ("http" if args.http else "client", dialect, records, concurrency)
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    if args.save_baseline:
+        stored[key] = {name: result for name, result in results.items() if result}
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print("baseline %s saved to %s" % (key, args.baseline))
+        return
+    if key not in stored:
+        print("no baseline for %s in %s (run with --save-baseline)" % (key, args.baseline))
+        return
+    regressions = compare(results, stored[key], args.tolerance)
+    for name, reason in regressions:
+        print("REGRESSION  %-20s %s" % (name, reason))
+    if regressions:
+        sys.exit(1)
+    print("no regressions against %s" % key)
+
+
+if __name__ == "__main__":
+    main()
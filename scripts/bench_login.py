@@ -0,0 +1,93 @@
+"""
+Login throughput under concurrency, and how much a burst of logins slows
+down the other endpoints.
+
+    $ python scripts/bench_login.py --threads 16 --logins 200
+    $ python scripts/bench_login.py --threads 16 --logins 200 --hash-workers 0   # hash inline
+
+Each run uses a temporary SQLite database.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8, help="concurrent clients logging in")
+    parser.add_argument("--logins", type=int, default=100, help="logins per client")
+    parser.add_argument("--hash-workers", type=int, default=None, help="PASSWORD_HASH_WORKERS (0 = inline)")
+    parser.add_argument("--method", default=None, help="PASSWORD_HASH_METHOD")
+    args = parser.parse_args()
+
+    # passwords.py lee la configuracion al importarse
+    if args.hash_workers is not None:
+        os.environ["PASSWORD_HASH_WORKERS"] = str(args.hash_workers)
+    if args.method is not None:
+        os.environ["PASSWORD_HASH_METHOD"] = args.method
+
+    from _app import load_app
+    app = load_app()
+    import passwords
+    from models import db, User
+
+    with app.api.app_context():
+        db.session.add(User(username="bench", password=passwords.hash_password("secret"), is_active=True))
+        db.session.commit()
+    # calienta el pool antes de medir
+    passwords.policy_prefix()
+
+    login_times, probe_times, errors = [], [], []
+    done = threading.Event()
+
+    def login_client():
+        client = app.api.test_client()
+        for i in range(args.logins):
+            start = time.perf_counter()
+            response = client.post("/login", json={"user": "bench", "password": "secret"})
+            login_times.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    def probe_client():
+        # un endpoint barato mientras duran los logins
+        client = app.api.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get("/users?limit=1")
+            probe_times.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    probe = threading.Thread(target=probe_client)
+    clients = [threading.Thread(target=login_client) for i in range(args.threads)]
+    start = time.perf_counter()
+    probe.start()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe.join()
+
+    print("hash method      %s (workers=%s, queue=%s)" % (passwords.policy_prefix(), passwords.PASSWORD_HASH_WORKERS,
+                                                          passwords.PASSWORD_HASH_QUEUE))
+    print("logins           %d in %.2fs, %.1f/s, %d errors %s" % (len(login_times), elapsed, len(login_times) / elapsed,
+                                                                  len(errors), sorted(set(errors))))
+    print("login latency    p50 %.1fms  p95 %.1fms  p99 %.1fms" % tuple(percentile(login_times, p) * 1000 for p in (50, 95, 99)))
+    print("/users latency   p50 %.1fms  p95 %.1fms  max %.1fms  (%d requests during the burst)" % (
+        percentile(probe_times, 50) * 1000, percentile(probe_times, 95) * 1000,
+        max(probe_times or [0]) * 1000, len(probe_times)))
+    if probe_times:
+        print("/users mean      %.1fms" % (statistics.mean(probe_times) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cost of the Prometheus instrumentation per request: the same cheap requests
+are timed with METRICS_ENABLED on and off, each in its own process.
+
+    $ python scripts/bench_metrics.py --requests 5000
+    $ python scripts/bench_metrics.py --multiproc      # with PROMETHEUS_MULTIPROC_DIR, as under gunicorn
+
+Each run uses a temporary SQLite database.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run_once(requests, path):
+    # corre en el proceso hijo, con METRICS_ENABLED ya definido
+    from _app import load_app
+    app = load_app()
+    client = app.api.test_client()
+    for i in range(200):
+        client.get(path)
+    start = time.perf_counter()
+    for i in range(requests):
+        client.get(path)
+    return (time.perf_counter() - start) / requests
+
+
+def measure(enabled, args):
+    env = dict(os.environ, METRICS_ENABLED="true" if enabled else "false")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    if args.multiproc and enabled:
+        env["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="api-consultas-metrics-")
+    output = subprocess.check_output([sys.executable, __file__, "--child", "--requests", str(args.requests),
+                                      "--path", args.path], env=env)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000, help="requests per run")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per setting, the best one counts")
+    parser.add_argument("--path", default="/user", help="endpoint to hit")
+    parser.add_argument("--multiproc", action="store_true", help="write samples to a PROMETHEUS_MULTIPROC_DIR")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_once(args.requests, args.path)))
+        return
+
+    off = min(measure(False, args) for i in range(args.rounds))
+    on = min(measure(True, args) for i in range(args.rounds))
+    print("GET %s x %d (best of %d)" % (args.path, args.requests, args.rounds))
+    print("metrics off      %.1fus/request" % (off * 1e6))
+    print("metrics on       %.1fus/request%s" % (on * 1e6, " (multiprocess)" if args.multiproc else ""))
+    print("overhead         %.1fus/request (%.1f%%)" % ((on - off) * 1e6, (on - off) / off * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Calls every endpoint once and fails if any of them runs more SQL statements
+than its budget, printing the statements of the ones over budget.
+
+    $ pipenv run check-queries
+    $ pipenv run check-queries --database-url postgresql://localhost/scratch
+
+By default a temporary SQLite database is migrated and seeded. Only point
+--database-url at a scratch database, the script writes to it. Edits that
+send dates as strings are skipped on SQLite, which only takes date objects.
+"""
+import argparse
+import sys
+
+from _app import load_app, seed
+
+PATIENT = {"name": "Ana", "last_name": "Diaz", "dni": "B0000001", "parish": "parish", "city": "city",
+           "mun": "mun", "country": "country", "date": None, "gender": "F", "number": "0",
+           "ant_fam": "ant fam", "ant_per": "ant per"}
+RECORD = {"date": "2024-02-01", "diagnosis": "diagnosis", "treatment": "treatment",
+          "recommendations": "recommendations", "diagnosis_diff": "diff", "diagnosis_eco": "eco",
+          "exams": "exams", "medications": "medications", "symtomps": "symtomps", "phy_exa": "phy_exa",
+          "signs": "signs", "observations": "observations"}
+OBSTETRIC = {"num_births": 1, "num_abort": 0, "menst_date": "2024-01-01", "type_preg": "none"}
+PAY = {"pesos": 2, "cash": 1, "pay_mov": 1, "biopago": 1, "point": 1}
+
+# (metodo, url, cuerpo, maximo de consultas, necesita fechas como texto); lo que resta
+# pagos del resumen diario lleva una sentencia mas, la que bloquea los pagos (rollup.lock_pays)
+BUDGETS = [
+    ("GET", "/users", None, 2, False),
+    ("POST", "/user", {"username": "created", "password": "created"}, 1, False),
+    ("GET", "/user/3", None, 1, False),
+    ("PUT", "/user/4", {"username": "renamed"}, 3, False),
+    ("GET", "/patients", None, 2, False),
+    ("GET", "/patient/3", None, 1, False),
+    ("GET", "/patient/3?include=records,records.pay,records.obstetric", None, 4, False),
+    ("GET", "/patients/search?q=Name", None, 1, False),
+    ("POST", "/patient", dict(PATIENT, dni="B9999999"), 1, False),
+    ("PUT", "/patient/4", PATIENT, 3, False),
+    ("PATCH", "/patient/5", {"city": "patched", "date": "1990-05-01"}, 1, False),
+    ("GET", "/records", None, 2, False),
+    ("GET", "/record/3", None, 1, False),
+    ("GET", "/records/search?q=medic", None, 1, False),
+    ("GET", "/records/search?q=medic&in=diagnosis,medications&fields=diagnosis", None, 1, False),
+    ("GET", "/record/patient/3", None, 2, False),
+    ("PUT", "/record/4", RECORD, 9, True),
+    ("PATCH", "/record/5", {"diagnosis": "patched", "signs": "patched"}, 1, False),
+    ("PATCH", "/record/6", {"date": "2024-03-01"}, 6, False),
+    ("GET", "/records/obstetric", None, 2, False),
+    ("GET", "/record/obstetric/3", None, 1, False),
+    ("PUT", "/record/obstetric/4", OBSTETRIC, 2, True),
+    ("PATCH", "/record/obstetric/5", {"num_births": 2, "menst_date": "2024-01-15"}, 1, False),
+    ("GET", "/pays", None, 2, False),
+    ("GET", "/pay/3", None, 1, False),
+    ("GET", "/pay/record/3", None, 1, False),
+    ("GET", "/pays/summary?from=2024-01-01&to=2024-01-31", None, 1, False),
+    ("POST", "/pay/5/", PAY, 4, False),
+    ("PUT", "/pay/4", PAY, 8, False),
+    ("PATCH", "/pay/5", {"cash": 3}, 6, False),
+    ("DELETE", "/pay/6", None, 5, False),
+    ("DELETE", "/record/7", None, 6, False),
+    ("DELETE", "/patient/12", None, 7, False),
+    ("DELETE", "/patients?ids=13,14,15", None, 7, False),
+    ("DELETE", "/patients", {"ids": [16, 17]}, 7, False),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    from models import db
+    from querystats import assert_max_queries
+
+    with app.api.app_context():
+        seed(patients=20)
+        dialect = db.engine.dialect.name
+
+    client = app.api.test_client()
+    failures = 0
+    for method, url, body, budget, date_strings in BUDGETS:
+        label = "%s %s" % (method, url)
+        if date_strings and dialect == "sqlite":
+            print("skip  %-62s (dates as strings)" % label)
+            continue
+        try:
+            with assert_max_queries(budget, label) as queries:
+                response = client.open(url, method=method, json=body)
+        except AssertionError as error:
+            failures += 1
+            print("FAIL  %s" % error)
+            continue
+        if response.status_code >= 400:
+            failures += 1
+            print("FAIL  %-62s status %d" % (label, response.status_code))
+            continue
+        print("ok    %-62s %d/%d queries" % (label, queries.count, budget))
+
+    if failures:
+        print("%d endpoint(s) over budget or failing" % failures)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
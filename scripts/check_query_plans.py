@@ -0,0 +1,115 @@
+"""
+Calls every endpoint of check_query_budget.py, runs EXPLAIN on each SQL
+statement it sent and fails if any of them needs a sequential scan of a table.
+
+The statements are captured with querystats.count_queries() while the
+endpoints run, so the plans are those of the SQL the handlers really send
+(etag queries, includes, cascades and rollup updates too), not of a copy.
+
+    $ pipenv run check-plans
+    $ pipenv run check-plans --verbose     # the plan of every statement
+    $ pipenv run check-plans --database-url postgresql://localhost/scratch
+
+By default a temporary SQLite database is migrated and seeded. Only point
+--database-url at a scratch database, the script writes to it.
+"""
+import argparse
+import sys
+
+from _app import load_app, seed
+from check_query_budget import BUDGETS
+
+# lo demas (PRAGMA, SAVEPOINT, SET...) no tiene plan
+EXPLAINED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def explain(connection, statement, parameters):
+    # executemany: el plan es el mismo para todas las filas
+    if isinstance(parameters, list):
+        parameters = parameters[0] if parameters else ()
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters or ()).all()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql("EXPLAIN " + statement, parameters or {}).all()
+    return [row[0] for row in rows]
+
+
+def is_sequential_scan(dialect, line):
+    if dialect == "sqlite":
+        # "SCAN t" recorre la tabla, "SCAN t USING INDEX" recorre un indice
+        # y "SCAN t VIRTUAL TABLE INDEX" consulta el indice FTS5
+        return line.startswith("SCAN ") and " USING " not in line and " VIRTUAL TABLE INDEX " not in line
+    return "Seq Scan" in line
+
+
+def is_first_page(dialect, statement, plan):
+    """True for the first page of a collection: SQLite reads the table in id
+    order and stops at the LIMIT, but shows it as a plain "SCAN t" too"""
+    # sin WHERE ni ordenacion en un B-tree temporal el SCAN ya va en el orden del ORDER BY
+    return (dialect == "sqlite" and " LIMIT " in statement and " WHERE " not in statement
+            and not any("USE TEMP B-TREE" in line for line in plan))
+
+
+def statement_plans(engine, queries):
+    """(statement, plan) for every distinct statement of a count_queries() block"""
+    seen = set()
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            # con pocas filas Postgres prefiere recorrer la tabla; asi solo lo
+            # hace cuando no hay ningun indice que sirva
+            connection.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in zip(queries.statements, queries.parameters):
+            if statement in seen or not statement.lstrip().upper().startswith(EXPLAINED):
+                continue
+            seen.add(statement)
+            yield statement, explain(connection, statement, parameters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="scratch database to use (default: temporary SQLite)")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every statement")
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    from models import db
+    from querystats import count_queries
+
+    with app.api.app_context():
+        seed()
+        engine = db.engine
+        dialect = engine.dialect.name
+        with engine.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+
+    client = app.api.test_client()
+    failures = 0
+    for method, url, body, budget, date_strings in BUDGETS:
+        label = "%s %s" % (method, url)
+        if date_strings and dialect == "sqlite":
+            print("skip  %-62s (dates as strings)" % label)
+            continue
+        with count_queries() as queries:
+            response = client.open(url, method=method, json=body)
+        if response.status_code >= 400:
+            failures += 1
+            print("FAIL  %-62s status %d" % (label, response.status_code))
+            continue
+
+        with app.api.app_context():
+            plans = list(statement_plans(engine, queries))
+        scans = [(statement, plan) for statement, plan in plans
+                 if any(is_sequential_scan(dialect, line) for line in plan)
+                 and not is_first_page(dialect, statement, plan)]
+        failures += bool(scans)
+        print("%-5s %-62s %d statements" % ("FAIL" if scans else "ok", label, len(plans)))
+        for statement, plan in (plans if args.verbose else scans):
+            print("        %s\n          %s" % (" ".join(statement.split()), " | ".join(line.strip() for line in plan)))
+
+    if failures:
+        print("\n%d endpoint(s) send a statement that uses a sequential scan or fail" % failures)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,36 @@ import os
 from flask_admin import Admin
 from models import db, User, Patient, Pay, Record, Record_Obst
 from flask_admin.contrib.sqla import ModelView
+from bulk import DELETED_PAYS
+import rollup
+
+
+class RollupModelView(ModelView):
+    """ModelView that keeps the daily pay rollup (rollup.py) up to date, like the API does"""
+
+    def changed_pays(self, model):
+        # los pagos cuyo importe o dia cambia al editar este modelo
+        if isinstance(model, Pay):
+            return Pay.id == model.id
+        if isinstance(model, Record):
+            return Pay.id_record == model.id
+        return None
+
+    def on_model_change(self, form, model, is_created):
+        pay_filter = self.changed_pays(model)
+        if pay_filter is None:
+            return
+        if not is_created:
+            # el formulario ya cambio el objeto: se resta lo que hay en la base, sin volcarlo antes
+            with self.session.no_autoflush:
+                rollup.apply_pays(pay_filter, -1, self.session)
+        self.session.flush()
+        rollup.apply_pays(self.changed_pays(model), 1, self.session)
+
+    def on_model_delete(self, model):
+        # los pagos que se borran, tambien los que caen en cascada
+        rollup.apply_pays(DELETED_PAYS[type(model)]([model.id]), -1, self.session)
+
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
@@ -11,9 +41,9 @@ def setup_admin(app):
     
     # Add your models here, for example this is how we add a the User model to the admin
     admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Patient, db.session))
-    admin.add_view(ModelView(Pay, db.session))
-    admin.add_view(ModelView(Record, db.session))
+    admin.add_view(RollupModelView(Patient, db.session))
+    admin.add_view(RollupModelView(Pay, db.session))
+    admin.add_view(RollupModelView(Record, db.session))
     admin.add_view(ModelView(Record_Obst, db.session))
 
     # You can duplicate that line to add mew models
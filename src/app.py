@@ -2,19 +2,35 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
+from flask import Flask, Response, request, jsonify, url_for, stream_with_context
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from sqlalchemy.exc import IntegrityError
+from utils import (APIException, generate_sitemap, paginate, page_response, page_window, get_page_args, encode_cursor,
+                   make_etag, http_last_modified, query_version, get_fields, parse_ids, is_not_modified, not_modified_response,
+                   add_validators)
+from search import search_patients, search_records
+from bulk import bulk_insert, insert_unique, update_fields, validate_fields, delete_rows, MAX_BULK_ITEMS
+from importer import import_rows, read_rows
+from cache import response_cache
+from reports import pay_summary
+import rollup
+from pool import engine_options, setup_statement_timeout, setup_sqlite_foreign_keys, describe_pool
+from metrics import setup_metrics
+from compression import setup_compression
+from querystats import setup_query_stats
 from admin import setup_admin
+from commands import setup_commands
+from jsonprovider import COMPACT, setup_json
 from models import db, User, Patient, Record, Record_Obst, Pay
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from passwords import hash_password, check_password, needs_rehash
 #from models import Person
 
 api = Flask(__name__)
 api.url_map.strict_slashes = False
+setup_json(api)
 
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
@@ -22,11 +38,28 @@ if db_url is not None:
 else:
     api.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 api.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+api.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(api.config['SQLALCHEMY_DATABASE_URI'])
+# sin clave propia los tokens se firmarian con una clave conocida: no arrancamos
+jwt_secret = os.environ.get('JWT_SECRET_KEY') or os.environ.get('FLASK_APP_KEY')
+if not jwt_secret:
+    raise RuntimeError("JWT_SECRET_KEY is not set, the access tokens need a secret key")
+api.config['JWT_SECRET_KEY'] = jwt_secret
 
 MIGRATE = Migrate(api, db)
 db.init_app(api)
-CORS(api)
+with api.app_context():
+    setup_statement_timeout(db.engine)
+    setup_sqlite_foreign_keys(db.engine)
+    setup_query_stats(api, db.engine)
+# el cursor de las listas va en una cabecera: sin exponerla, un navegador
+# desde otro origen no puede pasar de la primera pagina
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "ETag"]
+CORS(api, expose_headers=CORS_EXPOSE_HEADERS)
+JWTManager(api)
 setup_admin(api)
+setup_commands(api)
+setup_metrics(api)
+setup_compression(api)
 
 # Handle/serialize errors like a JSON object
 @api.errorhandler(APIException)
@@ -38,6 +71,85 @@ def handle_invalid_usage(error):
 def sitemap():
     return generate_sitemap(api)
 
+# serve one row from the response cache, or load and cache it
+def cached_row_response(model, id, not_found):
+    # la cache guarda (cuerpo, etag, last_modified); sin entrada basta con
+    # cargar la fila para responder 304, solo se serializa si hay que enviarla
+    entry = response_cache.get(model.__name__, id)
+    if entry is None:
+        row = db.session.get(model, id)
+        if not row:
+            return jsonify({"error": not_found}), 404
+        etag = make_etag(model.__name__, id, row.updated_at)
+        last_modified = http_last_modified(row.updated_at)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        entry = (api.json.response(row.serialize()).get_data(), etag, last_modified)
+        response_cache.set(model.__name__, id, entry)
+
+    body, etag, last_modified = entry
+    if is_not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    return add_validators(Response(body, mimetype="application/json"), etag, last_modified)
+
+# 304 for a collection whose rows did not change since the client's copy
+def collection_version(query, model, fields):
+    # otros campos son otra representacion, con otro etag
+    window, limit = page_window(query, model.id)
+    return query_version(window, model.id, model.updated_at, ",".join(fields))
+
+# campos que se pueden editar con PUT y PATCH
+PATIENT_FIELDS = ("name", "last_name", "dni", "parish", "mun", "city", "date", "gender", "number",
+                  "ant_fam", "ant_per")
+RECORD_FIELDS = ("date", "diagnosis", "treatment", "recommendations", "diagnosis_diff", "diagnosis_eco", "exams",
+                 "medications", "symtomps", "phy_exa", "signs", "observations")
+OBSTETRIC_FIELDS = ("num_births", "num_abort", "menst_date", "type_preg")
+PAY_FIELDS = ("pesos", "cash", "pay_mov", "biopago", "point")
+
+# PATCH: only the fields sent, with one UPDATE ... RETURNING and no SELECT before
+def patch_row(model, id, fields, key, not_found, pays=None, conflict="conflicts with an existing row"):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "expected an object"}), 400
+    unknown = sorted(set(data) - set(fields))
+    if unknown:
+        return jsonify({"error": "fields that cannot be updated: %s" % ", ".join(unknown)}), 400
+    values, error = validate_fields(model, data, fields)
+    if error:
+        return jsonify({"error": error}), 400
+    if not values:
+        return jsonify({"error": "no fields to update"}), 400
+
+    # los pagos afectados salen del resumen diario antes del UPDATE y vuelven despues
+    pay_filter = pays(values) if pays else None
+    try:
+        if pay_filter is not None:
+            rollup.apply_pays(pay_filter, -1)
+        row = update_fields(model, id, values)
+        if row is None:
+            db.session.rollback()
+            return jsonify({"error": not_found}), 404
+        if pay_filter is not None:
+            rollup.apply_pays(pay_filter, 1)
+        db.session.commit()
+        return jsonify({key: row}), 200
+
+    except IntegrityError:
+        # un valor unico repetido (el dni de otro paciente), como al crear
+        db.session.rollback()
+        raise APIException(conflict, status_code=409)
+    except Exception as error:
+        db.session.rollback()
+        return jsonify([str(arg) for arg in error.args]), 500
+
+@api.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(describe_pool(db.engine.pool)), 200
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats()), 200
+
 @api.route('/user', methods=['GET'])
 def handle_hello():
 
@@ -64,9 +176,14 @@ def user_login():
         return jsonify({"error":"User not found"}), 404
     
     #obtenemos el password y lo comparamos
-    password_check= check_password_hash(user_exist.password, password)
+    password_check= check_password(user_exist.password, password)
     if not password_check:
         return jsonify({"error":"Password incorrecto"}), 401
+
+    #si cambio la politica de hash se guarda el password con la nueva
+    if needs_rehash(user_exist.password):
+        user_exist.password = hash_password(password)
+        db.session.commit()
    
     #se crea el token
     token_data={"id": user_exist.id, "user": user_exist.username}
@@ -79,9 +196,10 @@ def user_login():
 #get all users
 @api.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    serialized_user = [user.serialize() for user in users]
-    return jsonify(serialized_user), 200
+    fields = get_fields(User)
+    users, next_cursor = paginate(User.serialize_query(fields), User.id)
+    serialized_user = User.serialize_rows(users, fields)
+    return page_response(serialized_user, next_cursor)
 
  #GET user by id
 @api.route('/user/<int:id>', methods=['GET'])
@@ -98,19 +216,17 @@ def create_user():
     data = request.get_json()
     username = data.get("username", None)
     password= data.get("password", None)
-     # validamos que el usuario no exista
-    user_exist = User.query.filter_by(username=username).first()
-    if user_exist:
-        return jsonify({"error": "User exist"}), 404
-    
-    #si no existe continuamos
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
 
     try:
-        new_user = User(username=username,  password=hashed_password, is_active=True)
-        db.session.add(new_user)
+        # un solo INSERT: la restriccion unica de username dice si ya existe
+        new_user = insert_unique(User, {"username": username, "password": hashed_password, "is_active": True},
+                                 "username")
+        if new_user is None:
+            db.session.rollback()
+            return jsonify({"error": "User exist"}), 404
         db.session.commit()
-        return jsonify(new_user.serialize()), 201
+        return jsonify(new_user), 201
 
     except Exception as error:
         db.session.rollback()
@@ -125,23 +241,22 @@ def edit_user(id):
     password= data.get("password", None)
 
      # validamos que el usuario exista
-    user_exist = User.query.filter_by(id=id).first()
-    if not user_exist:
+    update_user = db.session.get(User, id)
+    if not update_user:
         return jsonify({"error": "User exist"}), 404
     
     #si no existe el paswword se le asigna su mismo valor
     if not password:
-       password=user_exist.password
+       password=update_user.password
 
     #de los contrario se hashead el nuevo
-    password = generate_password_hash(password)
+    else:
+       password = hash_password(password)
 
      
     try:
         
 
-        update_user = User.query.get(id)
-
         update_user.password= password
         update_user.username = username
         db.session.commit()
@@ -173,14 +288,52 @@ def delete_user_by_id(id):
 ##########################CRUD PATIENT#########################################
 
 
+# relaciones que se pueden pedir con ?include= en get_patient_by_id
+PATIENT_INCLUDES = {"records", "records.pay", "records.obstetric"}
+
+def parse_include(include):
+    if not include:
+        return set()
+    include = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = include - PATIENT_INCLUDES
+    if unknown:
+        raise APIException("unknown include: %s" % ", ".join(sorted(unknown)), status_code=400)
+    # records.pay y records.obstetric necesitan los registros
+    include.add("records")
+    return include
+
+def serialize_chart(patient, include):
+    chart = patient.serialize()
+    chart["records"] = []
+    for record in sorted(patient.record, key=lambda record: (record.date, record.id)):
+        serialized = record.serialize()
+        if "records.pay" in include:
+            serialized["pay"] = [pay.serialize() for pay in record.pay]
+        if "records.obstetric" in include:
+            serialized["obstetric"] = [obstetric.serialize() for obstetric in record.record_obstr]
+        chart["records"].append(serialized)
+    return chart
+
 # get patient by id
 @api.route("/patient/<int:id>", methods=["GET"])
 #@jwt_required()
 def get_patient_by_id(id):
-        current_patient = Patient.query.get(id)
+        include = parse_include(request.args.get("include", None))
+        if not include:
+            return cached_row_response(Patient, id, "patient not found")
+
+        # selectinload trae cada nivel en una sola consulta: como maximo
+        # paciente + registros + pagos + obstetricos, sin importar cuantos haya
+        records = db.selectinload(Patient.record)
+        options = [records]
+        if "records.pay" in include:
+            options.append(records.selectinload(Record.pay))
+        if "records.obstetric" in include:
+            options.append(records.selectinload(Record.record_obstr))
+        current_patient = db.session.get(Patient, id, options=options)
         if not current_patient:
             return jsonify({"error": "patient not found"}), 404
-        return jsonify(current_patient.serialize()), 200
+        return jsonify(serialize_chart(current_patient, include)), 200
 
 
 
@@ -188,10 +341,31 @@ def get_patient_by_id(id):
 @api.route("/patients", methods=["GET"])
 #@jwt_required()
 def get_patients():
-    patients = Patient.query.all()
-    return jsonify({"patienst": [patient.serialize() for patient in patients]}), 200
+    fields = get_fields(Patient)
+    etag = collection_version(Patient.query, Patient, fields)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    patients, next_cursor = paginate(Patient.serialize_query(fields), Patient.id)
+    response = page_response({"patienst": Patient.serialize_rows(patients, fields)}, next_cursor)
+    return add_validators(response, etag)
    
 
+# search patients by name, last name or dni
+@api.route("/patients/search", methods=["GET"])
+#@jwt_required()
+def search_patient():
+    # los resultados van por relevancia, asi que el cursor guarda el offset
+    limit, offset = get_page_args()
+    offset = offset or 0
+    fields = get_fields(Patient)
+    patients = search_patients(request.args.get("q", None), limit + 1, offset)
+    next_cursor = None
+    if len(patients) > limit:
+        patients = patients[:limit]
+        next_cursor = encode_cursor(offset + limit)
+    return page_response({"patients": [patient.serialize(fields) for patient in patients]}, next_cursor)
+
+
 # create a patient
 @api.route("/patient", methods=["POST"])
 def create_patient():
@@ -208,14 +382,9 @@ def create_patient():
     ant_fam = data.get("ant_fam", None)
     ant_per = data.get("ant_per", None)
 
-    # validamos que el patient no exista
-    patient_exist = Patient.query.filter_by(dni=dni).first()
-    if patient_exist:
-        return jsonify({"error": "patient exist"}), 404
-
-    
     try:
-        new_patient = Patient(
+        # un solo INSERT: la restriccion unica de dni dice si el paciente ya existe
+        new_patient = insert_unique(Patient, dict(
             name=name,
             last_name=last_name,
             parish=parish,
@@ -227,12 +396,13 @@ def create_patient():
             date=date,
             ant_fam=ant_fam,
             ant_per=ant_per,
-     
-        )
-        db.session.add(new_patient)
+        ), "dni")
+        if new_patient is None:
+            db.session.rollback()
+            return jsonify({"error": "patient exist"}), 404
         db.session.commit()
 
-        return jsonify(new_patient.serialize()), 201
+        return jsonify(new_patient), 201
 
     except Exception as error:
         db.session.rollback()
@@ -260,15 +430,12 @@ def edit_patient(id):
 
     # validamos que el patient no exista
 
-    patient_exist = Patient.query.filter_by(id=id).first()
-    if not patient_exist:
+    update_patient = db.session.get(Patient, id)
+    if not update_patient:
         return jsonify({"error": "patient not exist"}), 404
 
 
     try:
-        update_patient = Patient.query.get(id)
-        if not update_patient:
-            return jsonify({"error": "patient not found"}), 404
 
         update_patient.name = name
         update_patient.last_name = last_name
@@ -290,43 +457,92 @@ def edit_patient(id):
         return jsonify(error), 500
 
 
+# update some fields of a patient
+@api.route("/patient/<int:id>", methods=["PATCH"])
+#@jwt_required()
+def patch_patient(id):
+    return patch_row(Patient, id, PATIENT_FIELDS, "Patient", "patient not exist", conflict="patient exist")
+
+
 # delete patient
 @api.route("/patient/<int:id>", methods=["DELETE"])
 #@jwt_required()
 def delete_patient_by_id(id):
-    patient_to_delete = Patient.query.get(id)
-
-    if not patient_to_delete:
-        return jsonify({"error": "patient not found"}), 404
-
+    # sus records, records obstetricos y pagos los borra la base en cascada
     try:
-        db.session.delete(patient_to_delete)
+        if not delete_rows(Patient, [id]):
+            db.session.rollback()
+            return jsonify({"error": "patient not found"}), 404
         db.session.commit()
         return jsonify("patient deleted successfully"), 200
 
     except Exception as error:
         db.session.rollback()
-        return error, 500
+        return jsonify([str(arg) for arg in error.args]), 500
+
+
+# delete many patients, with everything that belongs to them: ?ids=1,2,3 or a
+# {"ids": [...]} body. gunicorn cuts the request line at 4094 bytes (some 600
+# ids), longer lists have to go in the body
+@api.route("/patients", methods=["DELETE"])
+#@jwt_required()
+def delete_patients():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and "ids" in data:
+        ids = parse_ids(data["ids"], MAX_BULK_ITEMS)
+    else:
+        ids = parse_ids(request.args.get("ids", None), MAX_BULK_ITEMS)
+    try:
+        deleted = delete_rows(Patient, ids)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        return jsonify([str(arg) for arg in error.args]), 500
+    missing = sorted(set(ids) - set(deleted))
+    return jsonify({"deleted": sorted(deleted), "not_found": missing}), 200
     
      ##########################CRUD RECORD#########################################
 
 #get all record
 @api.route('/records', methods=['GET'])
 def get_records():
-    records = Record.query.all()
-    serialized_user = [record.serialize() for record in records]
-    return jsonify(serialized_user), 200
+    fields = get_fields(Record)
+    etag = collection_version(Record.query, Record, fields)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    records, next_cursor = paginate(Record.serialize_query(fields), Record.id)
+    serialized_user = Record.serialize_rows(records, fields)
+    return add_validators(page_response(serialized_user, next_cursor), etag)
+
+
+# search records text, optionally only in some columns (?in=) and between two dates;
+# ?fields= chooses the keys of the response, as in the other collections
+@api.route("/records/search", methods=["GET"])
+#@jwt_required()
+def search_record():
+    limit, offset = get_page_args()
+    offset = offset or 0
+    fields = get_fields(Record)
+    records = search_records(
+        request.args.get("q", None),
+        request.args.get("in", None),
+        request.args.get("from", None),
+        request.args.get("to", None),
+        limit + 1,
+        offset,
+    )
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(offset + limit)
+    return page_response({"records": [record.serialize(fields) for record in records]}, next_cursor)
 
 
 # get record by id
 @api.route("/record/<int:id>", methods=["GET"])
 #@jwt_required()
 def get_record_by_id(id):
-        record = Record.query.get(id)
-        if not record:
-            return jsonify({"error": "record not found"}), 404
-
-        return jsonify(record.serialize()), 200
+        return cached_row_response(Record, id, "record not found")
 
 
 # get record by patient
@@ -334,10 +550,17 @@ def get_record_by_id(id):
 #@jwt_required()
 def get_record_by_id_appointment(id_patient):
 
-        records = Record.query.filter_by(id_patient=id_patient).all()
+        fields = get_fields(Record)
+        query = Record.query.filter_by(id_patient=id_patient)
+        etag = query_version(query, Record.id, Record.updated_at, ",".join(fields))
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+        records = query.with_entities(*Record.serialize_columns(fields)).order_by(Record.date).all()
         if not records:
             return jsonify({"error": "records not found"}), 404
-        return jsonify({"patients": [record.serialize() for record in records]}), 200
+        response = jsonify({"patients": Record.serialize_rows(records, fields)})
+        return add_validators(response, etag)
 
 
 
@@ -359,6 +582,7 @@ def create_record(id_patient):
         phy_exa=data.get("phy_exa", None)
         signs=data.get("signs", None)
         observations=data.get("observations", None)
+        type_pat=data.get("type_pat", None)
         id_patient = id_patient
 
         try:
@@ -375,6 +599,7 @@ def create_record(id_patient):
                 phy_exa=phy_exa,
                 signs=signs,
                 observations=observations,
+                type_pat=type_pat,
                 id_patient=id_patient,
             )
             db.session.add(new_record)
@@ -408,14 +633,16 @@ def edit_record(id):
       
 
         # validamos que el record exista
-        record_exist = Record.query.filter_by(id=id).first()
-        if not record_exist:
+        update_record = db.session.get(Record, id)
+        if not update_record:
             return jsonify({"error": "record not exist"}), 404
 
         try:
-            update_record = Record.query.get(id)
-            if not update_record:
-                return jsonify({"error": "record not found"}), 404
+
+            # si cambia la fecha sus pagos pasan a otro dia en el resumen diario
+            date_changed = str(update_record.date) != str(date)
+            if date_changed:
+                rollup.apply_pays(Pay.id_record == id, -1)
 
             update_record.date = date
             update_record.diagnosis = diagnosis
@@ -429,6 +656,9 @@ def edit_record(id):
             update_record.phy_exa = phy_exa
             update_record.signs = signs
             update_record.observations = observations
+            if date_changed:
+                db.session.flush()
+                rollup.apply_pays(Pay.id_record == id, 1)
 
             db.session.commit()
             return jsonify({"record": update_record.serialize()}), 200
@@ -439,22 +669,31 @@ def edit_record(id):
 
 
 
+# update some fields of a record
+@api.route("/record/<int:id>", methods=["PATCH"])
+#@jwt_required()
+def patch_record(id):
+        # con otra fecha sus pagos pasan a otro dia en el resumen diario
+        return patch_row(Record, id, RECORD_FIELDS, "record", "record not exist",
+                         pays=lambda values: Pay.id_record == id if "date" in values else None)
+
+
+
 # delete record
 @api.route("/record/<int:id>", methods=["DELETE"])
 #@jwt_required()
 def delete_record_by_id(id):
-        record_to_delete = Record.query.get(id)
-        if not record_to_delete:
-            return jsonify({"error": "record not found"}), 404
-
+        # sus records obstetricos y pagos los borra la base en cascada
         try:
-            db.session.delete(record_to_delete)
+            if not delete_rows(Record, [id]):
+                db.session.rollback()
+                return jsonify({"error": "record not found"}), 404
             db.session.commit()
             return jsonify("record deleted successfully"), 200
 
         except Exception as error:
             db.session.rollback()
-            return error, 500
+            return jsonify([str(arg) for arg in error.args]), 500
    
 
 
@@ -465,21 +704,22 @@ def delete_record_by_id(id):
 #@jwt_required()
 def get_records_obstetric():
 
-        records = Record_Obst.query.all()
+        fields = get_fields(Record_Obst)
+        etag = collection_version(Record_Obst.query, Record_Obst, fields)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+        records, next_cursor = paginate(Record_Obst.serialize_query(fields), Record_Obst.id)
         if not records:
             return jsonify({"error": "records obstetric not found"}), 404
-        return jsonify({"patients": [record.serialize() for record in records]}), 200
+        response = page_response({"patients": Record_Obst.serialize_rows(records, fields)}, next_cursor)
+        return add_validators(response, etag)
 
 
 # get record obstetric by id
 @api.route("/record/obstetric/<int:id>", methods=["GET"])
 #@jwt_required()
 def get_record_obstetric_by_id(id):
-        record = Record_Obst.query.get(id)
-        if not record:
-            return jsonify({"error": "record obstetric not found"}), 404
-
-        return jsonify(record.serialize()), 200
+        return cached_row_response(Record_Obst, id, "record obstetric not found")
 
 
 # get record obstetric by record
@@ -533,14 +773,11 @@ def edit_record_obstetric(id):
         type_preg = data.get("type_preg", None) 
 
         # validamos que el record exista
-        record_exist = Record_Obst.query.filter_by(id=id).first()
-        if not record_exist:
+        update_record = db.session.get(Record_Obst, id)
+        if not update_record:
             return jsonify({"error": "record not exist"}), 404
 
         try:
-            update_record = Record_Obst.query.get(id)
-            if not update_record:
-                return jsonify({"error": "record obstetric not found"}), 404
 
             update_record.num_births = num_births
             update_record.num_abort = num_abort
@@ -556,6 +793,14 @@ def edit_record_obstetric(id):
 
 
 
+# update some fields of an obstetric record
+@api.route("/record/obstetric/<int:id>", methods=["PATCH"])
+#@jwt_required()
+def patch_record_obstetric(id):
+        return patch_row(Record_Obst, id, OBSTETRIC_FIELDS, "record obstretic", "record not exist")
+
+
+
 # delete record obtretic
 @api.route("/record/obstetric/<int:id>", methods=["DELETE"])
 #@jwt_required()
@@ -580,28 +825,36 @@ def delete_record_obstetric_by_id(id):
 @api.route("/pay/<int:id>", methods=["GET"])
 #@jwt_required()
 def get_pay_by_id(id):
-        pay = Pay.query.get(id)
-        if not pay:
-            return jsonify({"error": "´pay not found"}), 404
-
-        return jsonify(pay.serialize()), 200
+        return cached_row_response(Pay, id, "´pay not found")
 
 #get all record
 @api.route('/pays', methods=['GET'])
 def get_pays():
-    pays = Pay.query.all()
-    serialized_pay = [pay.serialize() for pay in pays]
-    return jsonify(serialized_pay), 200
+    fields = get_fields(Pay)
+    etag = collection_version(Pay.query, Pay, fields)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    pays, next_cursor = paginate(Pay.serialize_query(fields), Pay.id)
+    serialized_pay = Pay.serialize_rows(pays, fields)
+    return add_validators(page_response(serialized_pay, next_cursor), etag)
+
+# payment totals per day, week or month
+@api.route("/pays/summary", methods=["GET"])
+#@jwt_required()
+def get_pays_summary():
+    summary = pay_summary(request.args.get("from", None), request.args.get("to", None), request.args.get("group", None))
+    return jsonify(summary), 200
 
 # get pay by record
 @api.route("/pay/record/<int:id_record>", methods=["GET"])
 #@jwt_required()
 def get_pay_by_id_record(id_record):
 
-        pay = Pay.query.filter_by(id_record=id_record).all()
+        fields = get_fields(Pay)
+        pay = Pay.serialize_query(fields).filter_by(id_record=id_record).all()
         if not pay:
             return jsonify({"error": "pay not found"}), 404
-        return jsonify({"Pay": [pay.serialize() for record in pay]}), 200
+        return jsonify({"Pay": Pay.serialize_rows(pay, fields)}), 200
 
 
 
@@ -627,6 +880,8 @@ def create_pay(id_record):
                 id_record=id_record,
             )
             db.session.add(new_pay)
+            db.session.flush()
+            rollup.apply_pays(Pay.id == new_pay.id, 1)
             db.session.commit()
 
             return jsonify(new_pay.serialize()), 201
@@ -648,21 +903,21 @@ def edit_pay(id):
         point = data.get("point", None)
 
         # validamos que el pago exista
-        pay_exist = Pay.query.filter_by(id=id).first()
-        if not pay_exist:
+        update_pay = db.session.get(Pay, id)
+        if not update_pay:
             return jsonify({"error": "pay not exist"}), 404
 
         try:
-            update_pay = Pay.query.get(id)
-            if not update_pay:
-                return jsonify({"error": "pay not found"}), 404
 
+            # se quita el pago viejo del resumen diario y se suma el nuevo
+            rollup.apply_pays(Pay.id == id, -1)
             update_pay.pesos = pesos
             update_pay.cash = cash
             update_pay.pay_mov = pay_mov
             update_pay.biopago = biopago
             update_pay.point= point
-
+            db.session.flush()
+            rollup.apply_pays(Pay.id == id, 1)
 
             db.session.commit()
             return jsonify({"pay": update_pay.serialize()}), 200
@@ -673,6 +928,15 @@ def edit_pay(id):
 
 
 
+# update some amounts of a pay
+@api.route("/pay/<int:id>", methods=["PATCH"])
+#@jwt_required()
+def patch_pay(id):
+        # todos los campos son importes: el pago siempre se rehace en el resumen diario
+        return patch_row(Pay, id, PAY_FIELDS, "pay", "pay not exist", pays=lambda values: Pay.id == id)
+
+
+
 # delete pay
 @api.route("/pay/<int:id>", methods=["DELETE"])
 #@jwt_required()
@@ -682,6 +946,7 @@ def delete_pay_by_id(id):
             return jsonify({"error": "pay not found"}), 404
 
         try:
+            rollup.apply_pays(Pay.id == id, -1)
             db.session.delete(pay_to_delete)
             db.session.commit()
             return jsonify("pay deleted successfully"), 200
@@ -691,6 +956,74 @@ def delete_pay_by_id(id):
             return error, 500
    
 
+##########################BULK###########################
+
+# create many patients, records or pays in one request
+@api.route("/<any(patients, records, pays):kind>/bulk", methods=["POST"])
+#@jwt_required()
+def create_bulk(kind):
+        items = request.get_json()
+        if not isinstance(items, list):
+            return jsonify({"error": "expected a list of items"}), 400
+        if len(items) > MAX_BULK_ITEMS:
+            return jsonify({"error": "at most %d items per request" % MAX_BULK_ITEMS}), 400
+
+        results = bulk_insert(kind, items)
+        created = sum(1 for result in results if result["status"] == 201)
+        return jsonify({"created": created, "failed": len(results) - created, "results": results}), 200
+
+
+# import a csv or xlsx file of patients or records
+@api.route("/import/<string:kind>", methods=["POST"])
+#@jwt_required()
+def import_file(kind):
+        upload = request.files.get("file", None)
+        if upload is None:
+            return jsonify({"error": "file is required"}), 400
+        batch_size = request.args.get("batch_size", 1000, type=int)
+
+        # solo devolvemos los primeros errores, el archivo puede ser enorme
+        errors = []
+        def collect_errors(stats, batch_errors):
+            errors.extend(batch_errors[:100 - len(errors)])
+
+        stats = import_rows(kind, read_rows(upload.stream, upload.filename or ""), max(batch_size, 1), on_batch=collect_errors)
+        return jsonify(dict(stats, errors=errors)), 200
+
+
+##########################EXPORT###########################
+
+# tablas que se pueden exportar completas
+EXPORT_MODELS = {
+    "records": Record,
+    "patients": Patient,
+    "pays": Pay,
+}
+EXPORT_BATCH_SIZE = 1000
+
+# export a full table as newline delimited json
+@api.route("/export/<string:table>.ndjson", methods=["GET"])
+#@jwt_required()
+def export_table(table):
+        model = EXPORT_MODELS.get(table)
+        if model is None:
+            return jsonify({"error": "table not found"}), 404
+
+        def generate():
+            # yield_per lee la tabla por lotes con un cursor del servidor; son
+            # tuplas, no objetos del ORM, asi la memoria no crece con el
+            # numero de filas
+            columns = model.serialize_columns()
+            rows = db.session.execute(
+                db.select(*columns).order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            for batch in rows.partitions():
+                # con separadores compactos OrjsonProvider escribe con orjson
+                yield "".join(api.json.dumps(row, **COMPACT) + "\n" for row in model.serialize_rows(batch))
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,374 @@
+"""
+ASGI entry point, an alternative to wsgi.py for database-bound traffic.
+
+The CRUD routes of patients, records, obstetric records and pays are served
+by async handlers on an async SQLAlchemy engine, so one process keeps many
+requests waiting on the database at the same time. Every other route (users,
+login, lists, search, reports, bulk, import, export, admin, metrics) goes to
+the Flask app in app.py through a2wsgi, which runs it in a thread pool. The
+URLs, bodies and status codes are the same as with wsgi.py.
+
+    $ uvicorn asgi:application --app-dir src --workers 2
+    $ gunicorn asgi:application --chdir src -k uvicorn.workers.UvicornWorker
+
+The async driver follows DATABASE_URL (asyncpg for postgres, aiosqlite for
+sqlite); ASYNC_DATABASE_URL overrides it, and is required for other databases
+(with their async driver installed by hand). The DB_POOL_*
+settings of pool.py apply per worker process. The async routes are not
+counted in /metrics, and with several uvicorn workers PROMETHEUS_MULTIPROC_DIR
+has to be set by hand (gunicorn.conf.py only does it for gunicorn).
+Their responses are compressed with starlette's gzip middleware (no brotli),
+with the COMPRESS_* settings of compression.py.
+"""
+import contextlib
+import os
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.http import http_date, quote_etag
+
+from app import (api, parse_include, serialize_chart, PATIENT_FIELDS, RECORD_FIELDS, OBSTETRIC_FIELDS,
+                 PAY_FIELDS, CORS_EXPOSE_HEADERS)
+from bulk import insert_unique, delete_rows
+from cache import response_cache
+from compression import COMPRESS_ENABLED, COMPRESS_MIN_SIZE, GZIP_LEVEL
+from models import Patient, Record, Record_Obst, Pay
+from pool import TimedQueuePool, engine_options, setup_statement_timeout, setup_sqlite_foreign_keys
+from querystats import instrument_engine
+from utils import APIException, make_etag, http_last_modified, parse_date, parse_fields, validators_match
+import rollup
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(database_url):
+    url = make_url(database_url)
+    if url.get_backend_name() not in ASYNC_DRIVERS:
+        raise RuntimeError("no async driver for %s, set ASYNC_DATABASE_URL" % url.get_backend_name())
+    return url.set(drivername="%s+%s" % (url.get_backend_name(), ASYNC_DRIVERS[url.get_backend_name()]))
+
+
+def async_engine_options(url):
+    options = engine_options(url)
+    # el pool de pool.py es sincrono; el motor async necesita su version adaptada
+    if options.get("poolclass") is TimedQueuePool:
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+
+database_url = os.getenv("ASYNC_DATABASE_URL") or async_database_url(api.config["SQLALCHEMY_DATABASE_URI"])
+engine = create_async_engine(database_url, **async_engine_options(database_url))
+setup_statement_timeout(engine.sync_engine)
+setup_sqlite_foreign_keys(engine.sync_engine)
+instrument_engine(engine.sync_engine)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+def json_body(value):
+    # el mismo JSON que jsonify() de app.py
+    return api.json.response(value).get_data()
+
+
+def json_response(value, status_code=200):
+    return Response(json_body(value), status_code=status_code, media_type="application/json")
+
+
+def with_validators(response, etag, last_modified=None):
+    response.headers["ETag"] = quote_etag(etag, weak=True)
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    return validators_match(etag, last_modified, request.headers.get("if-none-match"),
+                            request.headers.get("if-modified-since"))
+
+
+async def request_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        raise APIException("the body must be JSON", status_code=400)
+    if not isinstance(data, dict):
+        raise APIException("the body must be a JSON object", status_code=400)
+    return data
+
+
+def api_exception(request, error):
+    return json_response(error.to_dict(), error.status_code)
+
+
+async def cached_row_response(request, model, id, not_found):
+    """Same as cached_row_response() in app.py, sharing its cache"""
+    entry = response_cache.get(model.__name__, id)
+    if entry is None:
+        async with Session() as session:
+            row = await session.get(model, id)
+        if row is None:
+            return json_response({"error": not_found}, 404)
+        etag = make_etag(model.__name__, id, row.updated_at)
+        last_modified = http_last_modified(row.updated_at)
+        if not_modified(request, etag, last_modified):
+            return with_validators(Response(status_code=304), etag, last_modified)
+        entry = (json_body(row.serialize()), etag, last_modified)
+        response_cache.set(model.__name__, id, entry)
+
+    body, etag, last_modified = entry
+    if not_modified(request, etag, last_modified):
+        return with_validators(Response(status_code=304), etag, last_modified)
+    return with_validators(Response(body, media_type="application/json"), etag, last_modified)
+
+
+def set_fields(row, data, fields, dates=()):
+    for name in fields:
+        value = data.get(name, None)
+        # asyncpg no convierte texto a fecha como psycopg2
+        setattr(row, name, parse_date(value, name) if name in dates else value)
+
+
+async def create_row(model, data, fields, dates=(), **values):
+    row = model(**values)
+    set_fields(row, data, fields, dates)
+    async with Session() as session:
+        try:
+            session.add(row)
+            await session.flush()
+            if model is Pay:
+                await session.run_sync(lambda sync: rollup.apply_pays(Pay.id == row.id, 1, session=sync))
+            await session.commit()
+        except Exception as error:
+            await session.rollback()
+            return json_response([str(arg) for arg in error.args], 500)
+    return json_response(row.serialize(), 201)
+
+
+async def edit_row(model, id, data, fields, key, not_found, dates=()):
+    async with Session() as session:
+        row = await session.get(model, id)
+        if row is None:
+            return json_response({"error": not_found}, 404)
+        try:
+            # el resumen diario de pagos se ajusta igual que en app.py
+            if model is Pay:
+                await session.run_sync(lambda sync: rollup.apply_pays(Pay.id == id, -1, session=sync))
+            date_changed = model is Record and str(row.date) != str(data.get("date", None))
+            if date_changed:
+                await session.run_sync(lambda sync: rollup.apply_pays(Pay.id_record == id, -1, session=sync))
+            set_fields(row, data, fields, dates)
+            await session.flush()
+            if model is Pay:
+                await session.run_sync(lambda sync: rollup.apply_pays(Pay.id == id, 1, session=sync))
+            if date_changed:
+                await session.run_sync(lambda sync: rollup.apply_pays(Pay.id_record == id, 1, session=sync))
+            await session.commit()
+        except APIException:
+            raise
+        except Exception as error:
+            await session.rollback()
+            return json_response([str(arg) for arg in error.args], 500)
+    return json_response({key: row.serialize()}, 200)
+
+
+async def delete_row(model, id, not_found, deleted):
+    # un DELETE por id; los hijos los borra la base en cascada
+    async with Session() as session:
+        try:
+            if not await session.run_sync(lambda sync: delete_rows(model, [id], session=sync)):
+                await session.rollback()
+                return json_response({"error": not_found}, 404)
+            await session.commit()
+        except Exception as error:
+            await session.rollback()
+            return json_response([str(arg) for arg in error.args], 500)
+    return json_response(deleted, 200)
+
+
+##########################PATIENT###########################
+
+async def get_patient(request):
+    id = request.path_params["id"]
+    include = parse_include(request.query_params.get("include", None))
+    if not include:
+        return await cached_row_response(request, Patient, id, "patient not found")
+
+    records = selectinload(Patient.record)
+    options = [records]
+    if "records.pay" in include:
+        options.append(records.selectinload(Record.pay))
+    if "records.obstetric" in include:
+        options.append(records.selectinload(Record.record_obstr))
+    async with Session() as session:
+        patient = await session.get(Patient, id, options=options)
+        if patient is None:
+            return json_response({"error": "patient not found"}, 404)
+        return json_response(serialize_chart(patient, include))
+
+
+async def create_patient(request):
+    data = await request_json(request)
+    values = {name: data.get(name, None) for name in PATIENT_FIELDS}
+    values["date"] = parse_date(values["date"], "date")
+    async with Session() as session:
+        try:
+            # el mismo INSERT con ON CONFLICT que app.py
+            patient = await session.run_sync(lambda sync: insert_unique(Patient, values, "dni", session=sync))
+            if patient is None:
+                await session.rollback()
+                return json_response({"error": "patient exist"}, 404)
+            await session.commit()
+        except Exception as error:
+            await session.rollback()
+            return json_response([str(arg) for arg in error.args], 500)
+    return json_response(patient, 201)
+
+
+async def edit_patient(request):
+    return await edit_row(Patient, request.path_params["id"], await request_json(request), PATIENT_FIELDS,
+                          "Patient", "patient not exist", dates=("date",))
+
+
+async def delete_patient(request):
+    return await delete_row(Patient, request.path_params["id"], "patient not found", "patient deleted successfully")
+
+
+##########################RECORD###########################
+
+async def get_record(request):
+    return await cached_row_response(request, Record, request.path_params["id"], "record not found")
+
+
+async def get_patient_records(request):
+    id_patient = request.path_params["id_patient"]
+    fields = parse_fields(Record, request.query_params.get("fields"))
+    async with Session() as session:
+        # la misma version que query_version() en app.py
+        count, max_id, max_updated_at = (await session.execute(
+            select(func.count(), func.max(Record.id), func.max(Record.updated_at)).where(Record.id_patient == id_patient)
+        )).one()
+        etag = make_etag(count, max_id, max_updated_at, ",".join(fields))
+        if not_modified(request, etag):
+            return with_validators(Response(status_code=304), etag)
+        records = (await session.execute(
+            select(*Record.serialize_columns(fields)).where(Record.id_patient == id_patient).order_by(Record.date)
+        )).all()
+    if not records:
+        return json_response({"error": "records not found"}, 404)
+    return with_validators(json_response({"patients": Record.serialize_rows(records, fields)}), etag)
+
+
+async def create_record(request):
+    data = await request_json(request)
+    return await create_row(Record, data, RECORD_FIELDS + ("type_pat",), dates=("date",),
+                            id_patient=request.path_params["id_patient"])
+
+
+async def edit_record(request):
+    return await edit_row(Record, request.path_params["id"], await request_json(request), RECORD_FIELDS,
+                          "record", "record not exist", dates=("date",))
+
+
+async def delete_record(request):
+    return await delete_row(Record, request.path_params["id"], "record not found", "record deleted successfully")
+
+
+##########################RECORD_OBSTETRIC###########################
+
+async def get_record_obstetric(request):
+    return await cached_row_response(request, Record_Obst, request.path_params["id"], "record obstetric not found")
+
+
+async def create_record_obstetric(request):
+    data = await request_json(request)
+    return await create_row(Record_Obst, data, OBSTETRIC_FIELDS, dates=("menst_date",),
+                            id_record=request.path_params["id_record"])
+
+
+async def edit_record_obstetric(request):
+    return await edit_row(Record_Obst, request.path_params["id"], await request_json(request), OBSTETRIC_FIELDS,
+                          "record obstretic", "record not exist", dates=("menst_date",))
+
+
+async def delete_record_obstetric(request):
+    return await delete_row(Record_Obst, request.path_params["id"], "record obstetric not found",
+                            "record obstetric deleted successfully")
+
+
+##########################PAY###########################
+
+async def get_pay(request):
+    return await cached_row_response(request, Pay, request.path_params["id"], "´pay not found")
+
+
+async def get_record_pays(request):
+    fields = parse_fields(Pay, request.query_params.get("fields"))
+    async with Session() as session:
+        pays = (await session.execute(
+            select(*Pay.serialize_columns(fields)).where(Pay.id_record == request.path_params["id_record"])
+        )).all()
+    if not pays:
+        return json_response({"error": "pay not found"}, 404)
+    return json_response({"Pay": Pay.serialize_rows(pays, fields)})
+
+
+async def create_pay(request):
+    data = await request_json(request)
+    return await create_row(Pay, data, PAY_FIELDS, id_record=request.path_params["id_record"])
+
+
+async def edit_pay(request):
+    return await edit_row(Pay, request.path_params["id"], await request_json(request), PAY_FIELDS,
+                          "pay", "pay not exist")
+
+
+async def delete_pay(request):
+    return await delete_row(Pay, request.path_params["id"], "pay not found", "pay deleted successfully")
+
+
+# Flask pone CORS y comprime sus respuestas (flask-cors y compression.py); las
+# rutas async usan los middleware de starlette, el de gzip sin brotli. Los
+# preflight OPTIONS caen en Flask, que los contesta.
+middleware = [Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                         expose_headers=CORS_EXPOSE_HEADERS)]
+if COMPRESS_ENABLED:
+    middleware.append(Middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE, compresslevel=GZIP_LEVEL))
+
+routes = [
+    Route("/patient/{id:int}", get_patient, methods=["GET"], middleware=middleware),
+    Route("/patient", create_patient, methods=["POST"], middleware=middleware),
+    Route("/patient/{id:int}", edit_patient, methods=["PUT"], middleware=middleware),
+    Route("/patient/{id:int}", delete_patient, methods=["DELETE"], middleware=middleware),
+    Route("/record/{id:int}", get_record, methods=["GET"], middleware=middleware),
+    Route("/record/patient/{id_patient:int}", get_patient_records, methods=["GET"], middleware=middleware),
+    Route("/record/{id_patient:int}/", create_record, methods=["POST"], middleware=middleware),
+    Route("/record/{id:int}", edit_record, methods=["PUT"], middleware=middleware),
+    Route("/record/{id:int}", delete_record, methods=["DELETE"], middleware=middleware),
+    Route("/record/obstetric/{id:int}", get_record_obstetric, methods=["GET"], middleware=middleware),
+    Route("/record/obstetric/{id_record:int}/", create_record_obstetric, methods=["POST"], middleware=middleware),
+    Route("/record/obstetric/{id:int}", edit_record_obstetric, methods=["PUT"], middleware=middleware),
+    Route("/record/obstetric/{id:int}", delete_record_obstetric, methods=["DELETE"], middleware=middleware),
+    Route("/pay/{id:int}", get_pay, methods=["GET"], middleware=middleware),
+    Route("/pay/record/{id_record:int}", get_record_pays, methods=["GET"], middleware=middleware),
+    Route("/pay/{id_record:int}/", create_pay, methods=["POST"], middleware=middleware),
+    Route("/pay/{id:int}", edit_pay, methods=["PUT"], middleware=middleware),
+    Route("/pay/{id:int}", delete_pay, methods=["DELETE"], middleware=middleware),
+    # el resto de rutas, y los metodos que no estan arriba, los atiende Flask
+    Mount("/", app=WSGIMiddleware(api)),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+application = Starlette(routes=routes, exception_handlers={APIException: api_exception}, lifespan=lifespan)
@@ -0,0 +1,288 @@
+"""
+Bulk inserts for patients, records and pays. Every item is validated on its
+own, then each batch is written with a single executemany INSERT and one commit.
+insert_unique() is the single row INSERT of the create endpoints,
+update_fields() the single row UPDATE of the PATCH endpoints and
+delete_rows() the set-based DELETE of the delete endpoints.
+"""
+import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, Patient, Record, Record_Obst, Pay
+from cache import invalidate_row
+import rollup
+
+BATCH_SIZE = 1000
+MAX_BULK_ITEMS = 10000
+
+# dialectos con INSERT ... ON CONFLICT DO NOTHING
+CONFLICT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# filas que la base borra en cascada (ON DELETE CASCADE) con cada modelo:
+# (modelo hijo, columna que apunta al padre)
+CASCADES = {
+    Patient: [(Record, "id_patient")],
+    Record: [(Record_Obst, "id_record"), (Pay, "id_record")],
+}
+
+# los pagos que desaparecen al borrar filas de cada modelo
+DELETED_PAYS = {
+    Patient: lambda ids: Pay.id_record.in_(db.select(Record.id).where(Record.id_patient.in_(ids))),
+    Record: lambda ids: Pay.id_record.in_(ids),
+    Pay: lambda ids: Pay.id.in_(ids),
+}
+
+# campos que se aceptan en cada item, el resto se ignora
+BULK_MODELS = {
+    "patients": {
+        "model": Patient,
+        "fields": ["name", "last_name", "dni", "parish", "city", "mun", "date", "gender", "number", "ant_fam", "ant_per"],
+        "unique": "dni",
+        "conflict": "patient exist",
+    },
+    "records": {
+        "model": Record,
+        "fields": ["date", "diagnosis", "recommendations", "treatment", "diagnosis_diff", "diagnosis_eco", "exams",
+                   "medications", "symtomps", "phy_exa", "signs", "type_pat", "observations", "id_patient"],
+        "parent": ("id_patient", Patient, "patient not found"),
+    },
+    "pays": {
+        "model": Pay,
+        "fields": ["pesos", "cash", "pay_mov", "biopago", "point", "id_record"],
+        "parent": ("id_record", Record, "record not found"),
+        # se ejecuta con los ids nuevos antes del commit del lote
+        "after_insert": lambda ids: rollup.apply_pays(Pay.id.in_(ids), 1),
+    },
+}
+
+
+def convert_value(column, value):
+    """Checks value against the column type, returns (value, error)"""
+    if value is None:
+        if not column.nullable:
+            return None, "%s is required" % column.name
+        return None, None
+    python_type = column.type.python_type
+    if python_type is datetime.date:
+        if isinstance(value, datetime.date):
+            return value, None
+        try:
+            return datetime.date.fromisoformat(str(value)), None
+        except ValueError:
+            return None, "%s must be a date like 2024-09-21" % column.name
+    if python_type is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            return None, "%s must be an integer" % column.name
+        return value, None
+    if python_type is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None, "%s must be a number" % column.name
+        return float(value), None
+    if not isinstance(value, str):
+        return None, "%s must be a string" % column.name
+    if column.type.length is not None and len(value) > column.type.length:
+        return None, "%s is longer than %d characters" % (column.name, column.type.length)
+    return value, None
+
+
+def validate_item(spec, item):
+    """Returns (row, error) for one item of the payload"""
+    if not isinstance(item, dict):
+        return None, "item must be an object"
+    columns = spec["model"].__table__.columns
+    row = {}
+    for field in spec["fields"]:
+        value, error = convert_value(columns[field], item.get(field, None))
+        if error:
+            return None, error
+        row[field] = value
+    return row, None
+
+
+def validate_fields(model, item, fields):
+    """Returns (values, error) with the fields of `fields` present in item,
+    for partial updates"""
+    columns = model.__table__.columns
+    values = {}
+    for field in fields:
+        if field in item:
+            value, error = convert_value(columns[field], item[field])
+            if error:
+                return None, error
+            values[field] = value
+    return values, None
+
+
+def insert_rows(model, rows):
+    """Inserts rows with one executemany statement, returns the new ids in order"""
+    if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.session.execute(
+            db.insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        )
+        return result.scalars().all()
+    # sin RETURNING (mysql) dejamos que el ORM agrupe los INSERT
+    objects = [model(**row) for row in rows]
+    db.session.add_all(objects)
+    db.session.flush()
+    return [obj.id for obj in objects]
+
+
+def insert_unique(model, values, unique, session=None):
+    """Inserts one row with a single statement and lets the unique constraint
+    of the `unique` column reject duplicates, so two concurrent creates of the
+    same value cannot both succeed. Returns the serialize() dict of the new row,
+    or None when the value already exists. The caller commits."""
+    session = session if session is not None else db.session
+    dialect = session.get_bind().dialect
+    if dialect.name in CONFLICT_INSERTS and dialect.insert_returning:
+        statement = (
+            CONFLICT_INSERTS[dialect.name](model).values(values)
+            .on_conflict_do_nothing(index_elements=[unique])
+            .returning(*model.serialize_columns())
+        )
+        row = session.execute(statement).first()
+        return None if row is None else model.serialize_rows([row])[0]
+
+    # sin ON CONFLICT (mysql): el INSERT falla y solo entonces se mira si es
+    # la restriccion unica o otro error de integridad
+    row = model(**values)
+    session.add(row)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        column = getattr(model, unique)
+        if session.scalar(db.select(column).where(column == values.get(unique))) is not None:
+            return None
+        raise
+    return row.serialize()
+
+
+def update_fields(model, id, values, session=None):
+    """Updates the given columns of one row with a single UPDATE ... RETURNING,
+    without loading the row first. Returns the serialize() dict of the updated
+    row, or None when there is no row with that id. The caller commits."""
+    session = session if session is not None else db.session
+    statement = db.update(model).where(model.id == id).values(values)
+    # los objetos que ya esten en la sesion no se tocan: nada de SELECT extra
+    options = {"synchronize_session": False}
+    if session.get_bind().dialect.update_returning:
+        row = session.execute(statement.returning(*model.serialize_columns()), execution_options=options).first()
+    else:
+        # sin RETURNING (mysql) se lee la fila despues del UPDATE
+        if session.execute(statement, execution_options=options).rowcount == 0:
+            return None
+        row = session.execute(db.select(*model.serialize_columns()).where(model.id == id)).first()
+    if row is None:
+        return None
+    invalidate_row(session, model.__name__, id)
+    return model.serialize_rows([row])[0]
+
+
+def cascade_keys(model, ids, session):
+    """(model name, id) of every row the database deletes in cascade with
+    the rows of model matching ids (a list or a SELECT of ids)"""
+    keys = []
+    for child, column in CASCADES.get(model, ()):
+        child_ids = db.select(child.id).where(getattr(child, column).in_(ids))
+        keys.extend((child.__name__, id) for id in session.scalars(child_ids))
+        keys.extend(cascade_keys(child, child_ids, session))
+    return keys
+
+
+def delete_rows(model, ids, session=None):
+    """Deletes the rows of model with these ids with one DELETE, without
+    loading them or their children: the database removes their records,
+    obstetric records and pays (ON DELETE CASCADE). Returns the deleted ids.
+    The caller commits."""
+    session = session if session is not None else db.session
+    ids = list(ids)
+    # los pagos que van a desaparecer salen antes del resumen diario
+    if model in DELETED_PAYS:
+        rollup.apply_pays(DELETED_PAYS[model](ids), -1, session)
+    # solo los ids de los hijos, para sacarlos de la cache
+    keys = cascade_keys(model, ids, session)
+
+    statement = db.delete(model).where(model.id.in_(ids))
+    options = {"synchronize_session": False}
+    if session.get_bind().dialect.delete_returning:
+        deleted = session.scalars(statement.returning(model.id), execution_options=options).all()
+    else:
+        # sin RETURNING (mysql) se buscan antes los ids que existen
+        deleted = session.scalars(db.select(model.id).where(model.id.in_(ids))).all()
+        session.execute(statement, execution_options=options)
+    for model_name, id in keys + [(model.__name__, id) for id in deleted]:
+        invalidate_row(session, model_name, id)
+    return deleted
+
+
+def insert_batch(spec, batch, results, commit=True):
+    """Validates and inserts one batch of (index, item) pairs in its own
+    transaction. With commit=False the rows stay in the caller's transaction
+    and database errors are raised for the caller to roll back."""
+    model = spec["model"]
+    valid = []
+    for index, item in batch:
+        row, error = validate_item(spec, item)
+        if error:
+            results[index] = {"index": index, "status": 400, "error": error}
+        else:
+            valid.append((index, row))
+
+    # los padres y los duplicados se comprueban con una consulta por lote
+    if "parent" in spec and valid:
+        field, parent, error = spec["parent"]
+        wanted = {row[field] for index, row in valid}
+        found = set(db.session.execute(db.select(parent.id).where(parent.id.in_(wanted))).scalars())
+        for index, row in valid:
+            if row[field] not in found:
+                results[index] = {"index": index, "status": 404, "error": error}
+        valid = [(index, row) for index, row in valid if row[field] in found]
+
+    if "unique" in spec and valid:
+        field = spec["unique"]
+        column = getattr(model, field)
+        taken = set(db.session.execute(
+            db.select(column).where(column.in_({row[field] for index, row in valid}))
+        ).scalars())
+        unique = []
+        for index, row in valid:
+            if row[field] in taken:
+                results[index] = {"index": index, "status": 409, "error": spec["conflict"]}
+            else:
+                taken.add(row[field])
+                unique.append((index, row))
+        valid = unique
+
+    if not valid:
+        if commit:
+            db.session.rollback()
+        return []
+
+    try:
+        ids = insert_rows(model, [row for index, row in valid])
+        if "after_insert" in spec:
+            spec["after_insert"](ids)
+        if commit:
+            db.session.commit()
+    except Exception as error:
+        if not commit:
+            raise
+        db.session.rollback()
+        for index, row in valid:
+            results[index] = {"index": index, "status": 500, "error": str(error.args)}
+        return []
+
+    for (index, row), new_id in zip(valid, ids):
+        results[index] = {"index": index, "status": 201, "id": new_id}
+    return [dict(row, id=new_id) for (index, row), new_id in zip(valid, ids)]
+
+
+def bulk_insert(kind, items, batch_size=BATCH_SIZE):
+    """Inserts items of the given kind, returns one result per item, in order"""
+    spec = BULK_MODELS[kind]
+    results = [None] * len(items)
+    indexed = list(enumerate(items))
+    for start in range(0, len(indexed), batch_size):
+        insert_batch(spec, indexed[start:start + batch_size], results)
+    return results
@@ -0,0 +1,105 @@
+"""
+In-process LRU + TTL cache for the serialized JSON of single rows, keyed by
+(model name, id). Each gunicorn worker has its own cache, so a write seen by
+another worker is only picked up here when the entry expires (CACHE_TTL).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class ResponseCache:
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, model_name, id):
+        key = (model_name, id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, model_name, id, body):
+        key = (model_name, id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_name, id):
+        with self._lock:
+            if self._entries.pop((model_name, id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("CACHE_MAXSIZE", 1024)),
+    ttl=float(os.getenv("CACHE_TTL", 60)),
+)
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_flushed(session, flush_context):
+    # cubre los endpoints PUT/DELETE, el admin y cualquier otra escritura por el ORM
+    keys = session.info.setdefault("cache_keys", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        id = getattr(obj, "id", None)
+        if id is not None:
+            keys.add((type(obj).__name__, id))
+            response_cache.invalidate(type(obj).__name__, id)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed(session):
+    # otra vez tras el commit, por si otro hilo guardo la version vieja entre
+    # el flush y el commit
+    for model_name, id in session.info.pop("cache_keys", ()):
+        response_cache.invalidate(model_name, id)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back(session):
+    session.info.pop("cache_keys", None)
+
+
+def invalidate_row(session, model_name, id):
+    """For writes that skip the unit of work (a Core UPDATE or DELETE): the
+    flush listener never sees those rows"""
+    session.info.setdefault("cache_keys", set()).add((model_name, id))
+    response_cache.invalidate(model_name, id)
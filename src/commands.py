@@ -0,0 +1,87 @@
+"""
+Flask CLI commands, next to the `flask db` ones from Flask-Migrate
+"""
+import os
+import time
+import click
+from importer import IMPORT_KINDS, import_rows, read_rows
+from models import db, ImportCheckpoint
+from seed import seed_database
+import rollup
+
+
+def setup_commands(app):
+
+    @app.cli.command("import")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--kind", type=click.Choice(IMPORT_KINDS), required=True,
+                  help="patients, or records (visits, matched to patients by their dni column)")
+    @click.option("--batch-size", default=1000, show_default=True, help="rows per transaction")
+    @click.option("--checkpoint", default=None,
+                  help="name of the progress row used to resume [default: the absolute PATH]")
+    @click.option("--restart", is_flag=True, help="ignore an existing checkpoint and start from the first row")
+    def import_file(path, kind, batch_size, checkpoint, restart):
+        """Imports a .csv or .xlsx file of patients or visits."""
+        checkpoint = checkpoint or os.path.abspath(path)
+        skip = 0
+        previous = {"created": 0, "failed": 0, "pays": 0}
+        state = db.session.get(ImportCheckpoint, checkpoint)
+        if state is not None and restart:
+            db.session.delete(state)
+            db.session.commit()
+        elif state is not None:
+            if state.kind != kind:
+                raise click.ClickException("checkpoint %s belongs to another import, use --restart" % checkpoint)
+            skip = state.rows
+            previous = {key: getattr(state, key) for key in previous}
+            click.echo("resuming after row %d" % skip)
+
+        def save_checkpoint(stats, errors):
+            for error in errors:
+                click.echo("line %(line)d: %(status)d %(error)s" % error, err=True)
+            # en la transaccion del lote: o entran las filas y el progreso, o ninguno
+            totals = {key: stats[key] + previous[key] for key in previous}
+            db.session.merge(ImportCheckpoint(name=checkpoint, kind=kind, rows=stats["rows"], **totals))
+            click.echo("%d rows, %d created, %d failed" % (stats["rows"], totals["created"], totals["failed"]))
+
+        with open(path, "rb") as f:
+            stats = import_rows(kind, read_rows(f, path), batch_size, skip=skip, on_batch=save_checkpoint)
+        click.echo("done: %(rows)d rows, %(created)d created, %(failed)d failed, %(pays)d pays" % stats)
+
+    @app.cli.group("rollup")
+    def rollup_group():
+        """Daily payment totals used by /pays/summary."""
+
+    @rollup_group.command("rebuild")
+    def rollup_rebuild():
+        """Recomputes the daily totals from the pay table."""
+        click.echo("%d rollup rows written" % rollup.rebuild())
+
+    @rollup_group.command("verify")
+    def rollup_verify():
+        """Compares the daily totals with the pay table."""
+        differences = rollup.verify()
+        for day, method, expected, stored in differences:
+            click.echo("%s %-8s expected total=%s count=%s, stored total=%s count=%s"
+                       % (day, method, expected[0], expected[1], stored[0], stored[1]))
+        if differences:
+            raise click.ClickException("%d rollup rows differ, run `flask rollup rebuild`" % len(differences))
+        click.echo("rollup is up to date")
+
+    @app.cli.command("seed")
+    @click.option("--records", default=100000, show_default=True,
+                  help="records to add, each with a pay; one patient every 10 records, obstetric data for ~30%")
+    @click.option("--seed", "seed_value", default=0, show_default=True, help="same seed and size, same rows")
+    @click.option("--workers", default=os.cpu_count() or 1, show_default=True, help="generator processes")
+    def seed_command(records, seed_value, workers):
+        """Fills the database with synthetic patients, records, pays and obstetric records."""
+        start = time.perf_counter()
+
+        def progress(counts):
+            rows = sum(counts.values())
+            elapsed = time.perf_counter() - start
+            click.echo("%d records, %d rows, %.0f rows/min" % (counts["record"], rows, rows / elapsed * 60))
+
+        counts = seed_database(records, seed=seed_value, workers=workers, on_chunk=progress)
+        elapsed = time.perf_counter() - start
+        click.echo("done in %.1fs: %s" % (elapsed, ", ".join("%d %s" % (count, table) for table, count in counts.items())))
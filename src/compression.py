@@ -0,0 +1,128 @@
+"""
+gzip / brotli compression of the responses, negotiated with Accept-Encoding.
+
+Only text-like responses (JSON, NDJSON, text) of at least COMPRESS_MIN_SIZE
+bytes are compressed. Streamed responses (the ndjson export) are compressed
+chunk by chunk, flushing after every chunk so the client keeps receiving
+rows; their size is not known when the headers go out, so they are always
+compressed.
+
+The etags of utils.add_validators() are weak (W/"..."), so they stay valid
+for the compressed body; a strong etag set elsewhere is made weak when the
+body is compressed.
+
+brotli is used when the brotli package is installed and the client accepts
+it. COMPRESS_ENABLED=false turns compression off.
+"""
+import os
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_LEVEL = int(os.getenv("COMPRESS_BROTLI_LEVEL", 4))
+
+COMPRESS_MIMETYPES = {"application/json", "application/x-ndjson", "text/html", "text/plain", "text/csv"}
+
+
+class GzipCompressor:
+    def __init__(self, level=None):
+        # wbits 31: cabecera y cola gzip
+        self.compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+
+    def process(self, chunk):
+        return self.compressor.compress(chunk)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level=None):
+        self.compressor = brotli.Compressor(quality=BROTLI_LEVEL if level is None else level)
+
+    def process(self, chunk):
+        return self.compressor.process(chunk)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS = {"br": BrotliCompressor, "gzip": GzipCompressor}
+
+
+def compress(data, encoding, level=None):
+    compressor = COMPRESSORS[encoding](level)
+    return compressor.process(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, level=None):
+    # flush tras cada trozo: el cliente recibe las filas segun salen
+    compressor = COMPRESSORS[encoding](level)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        yield compressor.process(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+def negotiate_encoding():
+    # la mejor codificacion que acepta el cliente, br antes que gzip con el mismo q
+    return request.accept_encodings.best_match(list(COMPRESSORS))
+
+
+def weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(response):
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (request.method == "HEAD" or response.status_code < 200 or response.status_code in (204, 206)
+            or "Content-Encoding" in response.headers or "Content-Range" in response.headers):
+        return response
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # el stream se recorre despues, cuando el servidor envia el cuerpo
+        original = response.response
+        if hasattr(original, "close"):
+            response.call_on_close(original.close)
+        response.response = compress_stream(original, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    weaken_etag(response)
+    return response
+
+
+def setup_compression(app):
+    if not COMPRESS_ENABLED:
+        return
+
+    @app.after_request
+    def compress_after_request(response):
+        return compress_response(response)
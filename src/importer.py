@@ -0,0 +1,170 @@
+"""
+Streaming import of patients and visits from CSV or XLSX files. Rows are read
+one at a time and written through bulk.insert_batch, one transaction per batch,
+so memory stays bounded whatever the size of the file.
+"""
+import codecs
+import csv
+import datetime
+import itertools
+from models import db, Patient
+from bulk import BULK_MODELS, insert_batch, validate_fields
+from utils import APIException
+
+# columnas de pago opcionales en una fila de visita
+PAY_FIELDS = BULK_MODELS["pays"]["fields"][:-1]
+IMPORT_KINDS = ["patients", "records"]
+
+
+def read_csv(binary_stream):
+    # se decodifica linea a linea: TextIOWrapper no acepta el
+    # SpooledTemporaryFile de las subidas de werkzeug en python 3.10
+    for row in csv.DictReader(codecs.iterdecode(binary_stream, "utf-8-sig")):
+        yield row
+
+
+def read_xlsx(binary_stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise APIException("openpyxl is required to import .xlsx files", status_code=500)
+    # read_only no carga la hoja entera, va fila a fila
+    workbook = load_workbook(binary_stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else "" for cell in next(rows, [])]
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(binary_stream, filename):
+    """Yields every data row of a .csv or .xlsx file as a dict keyed by the header"""
+    if filename.lower().endswith(".xlsx"):
+        return read_xlsx(binary_stream)
+    if filename.lower().endswith(".csv"):
+        return read_csv(binary_stream)
+    raise APIException("only .csv and .xlsx files can be imported", status_code=400)
+
+
+def coerce_cell(column, value):
+    """Spreadsheet cells come as text (csv) or loosely typed (xlsx), fit them to the column"""
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return None
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    try:
+        if python_type is int and isinstance(value, (str, float)):
+            return int(float(value)) if float(value).is_integer() else value
+        if python_type is float and isinstance(value, str):
+            return float(value)
+    except ValueError:
+        # se queda como esta y bulk devuelve el error de validacion
+        return value
+    if python_type is datetime.date and isinstance(value, datetime.datetime):
+        return value.date()
+    if python_type is str and isinstance(value, (int, float)):
+        return str(int(value)) if float(value).is_integer() else str(value)
+    return value
+
+
+def map_row(spec, row):
+    columns = spec["model"].__table__.columns
+    return {field: coerce_cell(columns[field], row.get(field, None)) for field in spec["fields"] if field in columns}
+
+
+def load_dni_lookup():
+    # un solo SELECT al empezar en lugar de una consulta por fila
+    return dict(db.session.execute(db.select(Patient.dni, Patient.id)).all())
+
+
+def import_batch(kind, rows, dni_lookup):
+    """Writes one batch of (line, row) pairs without committing, returns one
+    result per row and the number of pays created"""
+    results = [None] * len(rows)
+    created_pays = 0
+
+    if kind == "patients":
+        items = [(i, map_row(BULK_MODELS["patients"], row)) for i, (line, row) in enumerate(rows)]
+        insert_batch(BULK_MODELS["patients"], items, results, commit=False)
+    else:
+        items = []
+        pays = []
+        for i, (line, row) in enumerate(rows):
+            item = map_row(BULK_MODELS["records"], row)
+            dni = coerce_cell(Patient.__table__.columns["dni"], row.get("dni", None))
+            item["id_patient"] = dni_lookup.get(dni, None)
+            if item["id_patient"] is None:
+                results[i] = {"index": i, "status": 404, "error": "patient with dni %s not found" % dni}
+                continue
+            pay = map_row(BULK_MODELS["pays"], row)
+            if any(pay.get(field) is not None for field in PAY_FIELDS):
+                # el pago se valida antes de crear la visita: una fila se crea entera o no se crea
+                values, error = validate_fields(BULK_MODELS["pays"]["model"], pay, PAY_FIELDS)
+                if error:
+                    results[i] = {"index": i, "status": 400, "error": "pay: " + error}
+                    continue
+                pays.append((i, values))
+            items.append((i, item))
+        insert_batch(BULK_MODELS["records"], items, results, commit=False)
+
+        # el pago de cada visita se enlaza con el registro recien creado
+        pays = [(i, dict(pay, id_record=results[i]["id"])) for i, pay in pays if results[i]["status"] == 201]
+        if pays:
+            pay_results = [None] * len(rows)
+            insert_batch(BULK_MODELS["pays"], pays, pay_results, commit=False)
+            for i, pay in pays:
+                if pay_results[i]["status"] != 201:
+                    # ya validado, no deberia pasar: mejor deshacer el lote que dejar la visita sin su pago
+                    raise ValueError("pay failed after validation: " + pay_results[i]["error"])
+                created_pays += 1
+    return results, created_pays
+
+
+def import_rows(kind, rows, batch_size, skip=0, on_batch=None):
+    """Imports rows (an iterator of dicts) in batches of batch_size, one
+    transaction per batch.
+
+    The first `skip` rows are skipped, to resume from a checkpoint. on_batch is
+    called with the stats and the errors of every batch inside its transaction,
+    just before the commit, so whatever it writes to the database (the
+    checkpoint of `flask import`) commits or rolls back with the batch.
+    """
+    if kind not in IMPORT_KINDS:
+        raise APIException("kind must be one of: %s" % ", ".join(IMPORT_KINDS), status_code=400)
+    stats = {"rows": skip, "created": 0, "failed": 0, "pays": 0}
+    dni_lookup = load_dni_lookup() if kind == "records" else {}
+
+    # linea 1 es la cabecera
+    numbered = enumerate(rows, start=2)
+    if skip:
+        numbered = itertools.islice(numbered, skip, None)
+    while True:
+        batch = list(itertools.islice(numbered, batch_size))
+        if not batch:
+            break
+        try:
+            results, created_pays = import_batch(kind, batch, dni_lookup)
+        except Exception as error:
+            # se deshace el lote entero: ni visitas sin su pago ni filas sueltas
+            db.session.rollback()
+            results = [{"status": 500, "error": str(error.args)}] * len(batch)
+            created_pays = 0
+
+        errors = []
+        for (line, row), result in zip(batch, results):
+            if result["status"] == 201:
+                stats["created"] += 1
+            else:
+                stats["failed"] += 1
+                errors.append({"line": line, "status": result["status"], "error": result["error"]})
+        stats["pays"] += created_pays
+        stats["rows"] += len(batch)
+        if on_batch is not None:
+            on_batch(stats, errors)
+        db.session.commit()
+    return stats
@@ -0,0 +1,103 @@
+"""
+JSON provider that writes responses with orjson and keeps Flask's output byte
+for byte: sorted keys, compact separators, non-ASCII escaped as \\uXXXX and
+dates as HTTP dates.
+
+orjson and the json module only disagree on a few values: floats outside
+1e-4 <= abs(x) < 1e16 (exponents, NaN, Infinity), integers over 64 bits, dicts
+with non-string keys and strings with lone surrogates. Those responses are
+written with the json module instead.
+
+JSON_PROVIDER=flask (or orjson not being installed) keeps Flask's provider.
+"""
+import os
+import re
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "orjson").strip().lower()
+
+COMPACT = {"separators": (",", ":")}
+NON_ASCII = re.compile(r"[^\x00-\x7e]")
+
+
+def escape(match):
+    # como json.dumps(ensure_ascii=True): \uXXXX, con pares sustitutos
+    # fuera del plano basico
+    code = ord(match.group())
+    if code < 0x10000:
+        return "\\u%04x" % code
+    code -= 0x10000
+    return "\\u%04x\\u%04x" % (0xd800 | (code >> 10), 0xdc00 | (code & 0x3ff))
+
+
+def float_mismatch(value):
+    """True if value holds a float that orjson writes differently than repr()"""
+    # se recorren los valores, no el texto: cuesta lo mismo con textos largos
+    kind = type(value)
+    if kind is str or kind is int or value is None:
+        return False
+    if isinstance(value, float):
+        return not (value == 0 or 1e-4 <= abs(value) < 1e16)
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return False
+    for item in value:
+        if type(item) is not str and float_mismatch(item):
+            return True
+    return False
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider whose compact output is written by orjson"""
+
+    def fast_dumps(self, obj):
+        """Compact JSON as bytes, or None when only the json module gives
+        Flask's exact output"""
+        # fechas y dataclasses pasan por default(), como en Flask
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if float_mismatch(obj):
+            return None
+        try:
+            body = orjson.dumps(obj, default=self.fast_default, option=option)
+        except TypeError:
+            return None
+        # DEL es ASCII pero el modulo json tambien lo escapa
+        if self.ensure_ascii and (not body.isascii() or b"\x7f" in body):
+            body = NON_ASCII.sub(escape, body.decode()).encode()
+        return body
+
+    def fast_default(self, obj):
+        value = self.default(obj)
+        if float_mismatch(value):
+            raise TypeError("written by the json module")
+        return value
+
+    def dumps(self, obj, **kwargs):
+        if kwargs == COMPACT:
+            body = self.fast_dumps(obj)
+            if body is not None:
+                return body.decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # en debug Flask indenta, eso lo sigue haciendo el modulo json
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(obj)
+        body = self.fast_dumps(obj)
+        if body is None:
+            body = super().dumps(obj, **COMPACT).encode()
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def setup_json(app):
+    if JSON_PROVIDER == "orjson" and orjson is not None:
+        app.json = OrjsonProvider(app)
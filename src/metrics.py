@@ -0,0 +1,78 @@
+"""
+Prometheus metrics for every route: request count by status, requests in
+flight and latency histograms, labelled with the route template and method.
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py
+does it) so every worker writes its samples there and /metrics adds them up.
+METRICS_ENABLED=false turns the instrumentation off.
+"""
+import os
+import time
+from flask import Response, g, request
+
+# prometheus_client pasa al modo multiproceso con la variable definida aunque este vacia
+# (PROMETHEUS_MULTIPROC_DIR= en .env) y escribe sus ficheros en el directorio actual
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,  # noqa: E402
+                               REGISTRY, generate_latest, multiprocess)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route, method and status",
+    ["endpoint", "method", "status"],
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route and method",
+    ["endpoint", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being served",
+    ["endpoint", "method"], multiprocess_mode="livesum",
+)
+
+
+def route_label():
+    # la plantilla de la ruta (/patient/<int:id>), no la URL, para no crear
+    # una serie por cada id
+    if request.url_rule is None:
+        return "<unmatched>"
+    return request.url_rule.rule
+
+
+def setup_metrics(app):
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_labels = (route_label(), request.method)
+        IN_PROGRESS.labels(*g.metrics_labels).inc()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def observe_request(error):
+        # teardown corre al final, tambien tras una respuesta en streaming
+        labels = g.pop("metrics_labels", None)
+        if labels is None:
+            return
+        LATENCY.labels(*labels).observe(time.perf_counter() - g.pop("metrics_start"))
+        REQUESTS.labels(*labels, str(g.pop("metrics_status", 500))).inc()
+        IN_PROGRESS.labels(*labels).dec()
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
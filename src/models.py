@@ -1,26 +1,72 @@
+import datetime
+import operator
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
 
-class User(db.Model):
+def utcnow():
+    # naive UTC, igual que CURRENT_TIMESTAMP en la base de datos
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+class Serializer:
+    """serialize() from a fixed list of (json key, column attribute) pairs.
+
+    The keys and the attribute getter are built once per model, and the same
+    keys turn rows of serialize_columns() into the serialize() dict, so list
+    endpoints can select plain tuples instead of loading ORM objects.
+    serialize_summary names the keys collections send by default."""
+    serialize_fields = ()
+    serialize_summary = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not cls.serialize_fields:
+            return
+        cls.serialize_keys = tuple(key for key, attribute in cls.serialize_fields)
+        cls.serialize_attributes = dict(cls.serialize_fields)
+        cls.summary_keys = cls.serialize_summary or cls.serialize_keys
+        cls.serialize_getter = operator.attrgetter(*(attribute for key, attribute in cls.serialize_fields))
+
+    def serialize(self, keys=None):
+        if keys is None:
+            return dict(zip(self.serialize_keys, self.serialize_getter(self)))
+        return {key: getattr(self, self.serialize_attributes[key]) for key in keys}
+
+    @classmethod
+    def serialize_columns(cls, keys=None):
+        keys = cls.serialize_keys if keys is None else keys
+        return [getattr(cls, cls.serialize_attributes[key]) for key in keys]
+
+    @classmethod
+    def serialize_query(cls, keys=None):
+        # las columnas de serialize() como tuplas, sin crear objetos del ORM;
+        # con keys solo esas columnas entran en el SELECT
+        return cls.query.with_entities(*cls.serialize_columns(keys))
+
+    @classmethod
+    def serialize_rows(cls, rows, keys=None):
+        keys = cls.serialize_keys if keys is None else keys
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def fields(*names):
+    # la clave del json es el nombre de la columna
+    return tuple((name, name) for name in names)
+
+class User(Serializer, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(300), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
 
+    # do not serialize the password, its a security breach
+    serialize_fields = (("id", "id"), ("name", "username"))
+
     def __repr__(self):
         return '<User %r>' % self.username
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.username,
-            # do not serialize the password, its a security breach
-        }
-    
-    
 
-class Patient(db.Model):
+class Patient(Serializer, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), unique=False, nullable=False)
     last_name=db.Column(db.String(120), unique=False, nullable=False)
@@ -33,34 +79,25 @@ class Patient(db.Model):
     number = db.Column(db.String(15), unique=False, nullable=False)
     ant_fam= db.Column(db.String(1000), unique=False, nullable=False)
     ant_per= db.Column(db.String(1000), unique=False, nullable=False)
-    record = db.relationship("Record", backref="patient", lazy=True)
+    updated_at = db.Column(db.DateTime, unique=False, nullable=True, default=utcnow, onupdate=utcnow)
+    record = db.relationship("Record", backref="patient", lazy=True, cascade="all, delete", passive_deletes=True)
+
+    serialize_fields = fields("id", "name", "dni", "last_name", "city", "parish", "mun", "date", "gender", "number",
+                              "ant_fam", "ant_per")
+    # los antecedentes son los textos largos
+    serialize_summary = ("id", "name", "dni", "last_name", "city", "parish", "mun", "date", "gender", "number")
 
     def __repr__(self):
         return f"<Patient {self.name}>"
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "dni": self.dni,
-            "last_name": self.last_name,
-            "city": self.city,
-            "parish": self.parish,
-            "mun": self.mun,
-            "date": self.date,
-            "gender": self.gender,
-            "number": self.number,
-            "ant_fam": self.ant_fam,
-            "ant_per": self.ant_per,
-        }
-
-
-class Record(db.Model):
+
+
+class Record(Serializer, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     diagnosis = db.Column(db.String(1000), unique=False, nullable=False)
     recommendations=db.Column(db.String(1000), unique=False, nullable=False)
     treatment = db.Column(db.String(1000), unique=False, nullable=False)
-    date = db.Column(db.Date, unique=False, nullable=False)
+    date = db.Column(db.Date, unique=False, nullable=False, index=True)
     diagnosis_diff = db.Column(db.String(1000), unique=False, nullable=False)
     diagnosis_eco = db.Column(db.String(1000), unique=False, nullable=False)    
     exams = db.Column(db.String(1000), unique=False, nullable=False)
@@ -70,78 +107,84 @@ class Record(db.Model):
     signs=db.Column(db.String(1000), unique=False, nullable=False)
     type_pat=db.Column(db.String(30), unique=False, nullable=False)
     observations=db.Column(db.String(1000), unique=False, nullable=False)
-    id_patient = db.Column(db.Integer, db.ForeignKey("patient.id"), nullable=False)
-    record_obstr = db.relationship("Record_Obst", backref="record", lazy=True)
-    pay = db.relationship("Pay", backref="record", lazy=True)
+    id_patient = db.Column(db.Integer, db.ForeignKey("patient.id", ondelete="CASCADE"), nullable=False)
+    updated_at = db.Column(db.DateTime, unique=False, nullable=True, default=utcnow, onupdate=utcnow)
+    record_obstr = db.relationship("Record_Obst", backref="record", lazy=True, cascade="all, delete",
+                                   passive_deletes=True)
+    pay = db.relationship("Pay", backref="record", lazy=True, cascade="all, delete", passive_deletes=True)
+
+    # historial de un paciente ordenado por fecha
+    __table_args__ = (db.Index("ix_record_id_patient_date", "id_patient", "date"),)
+
+    serialize_fields = fields("id", "diagnosis", "recommendations", "treatment", "date", "diagnosis_diff",
+                              "diagnosis_eco", "exams", "medications", "symtomps", "phy_exa", "signs", "type_pat",
+                              "observations", "id_patient")
+    serialize_summary = ("id", "date", "type_pat", "id_patient")
 
     def __repr__(self):
         return f"<Record {self.date}>"
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "diagnosis": self.diagnosis,
-            "recommendations": self.recommendations,
-            "treatment": self.treatment,
-            "date": self.date,
-            "diagnosis_diff": self.diagnosis_diff,
-            "diagnosis_eco": self.diagnosis_eco,
-            "exams": self.exams,
-            "medications": self.medications,
-            "symtomps": self.symtomps,
-            "phy_exa": self.phy_exa,
-            "signs": self.signs,
-            "type_pat": self.type_pat,
-            "observations": self.observations,
-
-
-        }
-
-class Record_Obst(db.Model):
+
+class Record_Obst(Serializer, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     num_births = db.Column(db.Integer, unique=False, nullable=False)
     num_abort = db.Column(db.Integer, unique=False, nullable=False)
     menst_date = db.Column(db.Date, unique=False, nullable=False)
     type_preg=db.Column(db.String(20), unique=False, nullable=False)
-    id_record = db.Column(db.Integer, db.ForeignKey("record.id"), nullable=False)
+    id_record = db.Column(db.Integer, db.ForeignKey("record.id", ondelete="CASCADE"), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, unique=False, nullable=True, default=utcnow, onupdate=utcnow)
  
 
+    serialize_fields = fields("id", "num_births", "num_abort", "menst_date", "type_preg")
+
     def __repr__(self):
         return f"<Record_Obst{self.id}>"
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "num_births": self.num_births,
-            "num_abort": self.num_abort,
-            "menst_date": self.menst_date,
-            "type_preg": self.type_preg,
 
-        }
 
-
-class Pay(db.Model):
+class Pay(Serializer, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     pesos = db.Column(db.Integer, unique=False, nullable=False)
     cash = db.Column(db.Integer, unique=False, nullable=False)
     pay_mov = db.Column(db.Float, unique=False, nullable=False)
     biopago = db.Column(db.Float, unique=False, nullable=False)
     point = db.Column(db.Float, unique=False, nullable=False)
-    id_record = db.Column(db.Integer, db.ForeignKey("record.id"), nullable=False)
+    id_record = db.Column(db.Integer, db.ForeignKey("record.id", ondelete="CASCADE"), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, unique=False, nullable=True, default=utcnow, onupdate=utcnow)
  
 
+    serialize_fields = fields("id", "pesos", "cash", "pay_mov", "biopago", "point", "id_record")
+
     def __repr__(self):
         return f"<Pay {self.id}>"
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "pesos": self.pesos,
-            "cash": self.cash,
-            "pay_mov": self.pay_mov,
-            "biopago": self.biopago,
-            "point": self.point,
-            "id_record": self.id_record,
 
-        }
 
+
+class PayDaily(Serializer, db.Model):
+    # totales por dia y metodo de pago, los mantiene rollup.py
+    day = db.Column(db.Date, primary_key=True)
+    method = db.Column(db.String(20), primary_key=True)
+    total = db.Column(db.Float, unique=False, nullable=False)
+    count = db.Column(db.Integer, unique=False, nullable=False)
+
+    serialize_fields = fields("day", "method", "total", "count")
+
+    def __repr__(self):
+        return f"<PayDaily {self.day} {self.method}>"
+
+
+class ImportCheckpoint(Serializer, db.Model):
+    # progreso de `flask import`, se guarda en la misma transaccion que cada lote
+    name = db.Column(db.String(500), primary_key=True)
+    kind = db.Column(db.String(20), unique=False, nullable=False)
+    rows = db.Column(db.Integer, unique=False, nullable=False)
+    created = db.Column(db.Integer, unique=False, nullable=False)
+    failed = db.Column(db.Integer, unique=False, nullable=False)
+    pays = db.Column(db.Integer, unique=False, nullable=False)
+    updated_at = db.Column(db.DateTime, unique=False, nullable=True, default=utcnow, onupdate=utcnow)
+
+    serialize_fields = fields("name", "kind", "rows", "created", "failed", "pays")
+
+    def __repr__(self):
+        return f"<ImportCheckpoint {self.name}>"
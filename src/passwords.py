@@ -0,0 +1,88 @@
+"""
+Password hashing in a bounded process pool.
+
+Hashing is deliberately slow, so it runs in worker processes instead of the
+thread serving the request; with gunicorn threads (see gunicorn.conf.py) the
+other requests keep being served meanwhile. When more than
+PASSWORD_HASH_QUEUE operations are already waiting the request fails fast
+with a 503 instead of piling up.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils import APIException
+
+# metodo de werkzeug, por ejemplo "scrypt" o "pbkdf2:sha256:600000"
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+# procesos por worker de gunicorn, el total es este numero por el de workers;
+# 0 hashea en el mismo proceso, util en desarrollo
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 1))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 32))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE)
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_policy_prefix = None
+
+
+def get_executor():
+    global _executor, _executor_pid
+    # gunicorn hace fork despues de importar la app: cada worker crea su pool
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def reset_executor(broken):
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def run_bounded(function, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return function(*args)
+    if not _slots.acquire(blocking=False):
+        raise APIException("too many password operations in progress, try again later", status_code=503)
+    try:
+        executor = get_executor()
+        try:
+            return executor.submit(function, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+        except BrokenProcessPool:
+            # un proceso del pool murio: se crea otro pool y se reintenta una vez
+            reset_executor(executor)
+            return get_executor().submit(function, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return run_bounded(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def check_password(pwhash, password):
+    return run_bounded(check_password_hash, pwhash, password)
+
+
+def policy_prefix():
+    """The "method:params" prefix of a hash made with the current policy, e.g. scrypt:32768:8:1"""
+    global _policy_prefix
+    if _policy_prefix is None:
+        _policy_prefix = hash_password("").split("$", 1)[0]
+    return _policy_prefix
+
+
+def needs_rehash(pwhash):
+    return pwhash.split("$", 1)[0] != policy_prefix()
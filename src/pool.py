@@ -0,0 +1,147 @@
+"""
+Database engine / connection pool settings from the environment, and live
+pool statistics for GET /pool/stats.
+
+    DB_POOL_SIZE=5              connections kept open per worker process
+    DB_MAX_OVERFLOW=10          extra connections allowed under load
+    DB_POOL_TIMEOUT=30          seconds to wait for a free connection
+    DB_POOL_RECYCLE=1800        reconnect connections older than this (seconds)
+    DB_POOL_PRE_PING=true       test connections on checkout (survives postgres restarts)
+    DB_STATEMENT_TIMEOUT_MS=0   postgres statement_timeout, 0 = no limit
+    DB_PGBOUNCER=false          behind PgBouncer in transaction mode: no pooling
+                                here (NullPool) and no prepared statements
+    DB_POOL_LOG_INTERVAL=0      log the pool stats every N seconds, 0 = never
+"""
+import logging
+import os
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+def env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+class PoolStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.last_log = time.monotonic()
+
+    def record(self, wait, timed_out=False):
+        with self.lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+pool_stats = PoolStats()
+POOL_LOG_INTERVAL = float(os.getenv("DB_POOL_LOG_INTERVAL", 0))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a free connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - start)
+        if POOL_LOG_INTERVAL and time.monotonic() - pool_stats.last_log >= POOL_LOG_INTERVAL:
+            pool_stats.last_log = time.monotonic()
+            logger.info("db pool %s", describe_pool(self))
+        return connection
+
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        # un archivo local, los ajustes de pool no aplican
+        return {}
+
+    options = {}
+    connect_args = {}
+    if env_bool("DB_PGBOUNCER", False):
+        # PgBouncer ya hace de pool; en modo transaccion las sentencias
+        # preparadas del servidor no sirven entre transacciones
+        options["poolclass"] = NullPool
+        if url.get_driver_name() == "psycopg":
+            connect_args["prepare_threshold"] = None
+        elif url.get_driver_name() == "asyncpg":
+            connect_args["statement_cache_size"] = 0
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        )
+    options["pool_pre_ping"] = env_bool("DB_POOL_PRE_PING", True)
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def setup_statement_timeout(engine):
+    """SET LOCAL statement_timeout at the start of every transaction (postgres only).
+
+    Per transaction instead of per connection so it also works through PgBouncer,
+    which does not forward startup options.
+    """
+    timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+    if not timeout or engine.dialect.name != "postgresql":
+        return
+
+    @event.listens_for(engine, "begin")
+    def set_statement_timeout(connection):
+        connection.exec_driver_sql("SET LOCAL statement_timeout = %d" % timeout)
+
+
+def setup_sqlite_foreign_keys(engine):
+    """PRAGMA foreign_keys=ON on every new SQLite connection (sqlite only).
+
+    SQLite ignores foreign keys, and so their ON DELETE CASCADE, unless each
+    connection turns them on.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def describe_pool(pool):
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                     overflow=pool.overflow())
+    stats.update(pool_stats.to_dict())
+    return stats
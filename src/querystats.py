@@ -0,0 +1,123 @@
+"""
+SQL statements and database time per request.
+
+Every response carries X-DB-Queries (statements run) and X-DB-Time
+(milliseconds spent in them), and statements slower than SLOW_QUERY_MS are
+logged with the route that ran them.
+
+    SLOW_QUERY_MS=200           log statements slower than this, 0 = never
+    DB_QUERY_HEADERS=true       add the X-DB-* headers to every response
+
+count_queries() / assert_max_queries() count the statements of any block of
+code, for scripts/check_query_budget.py and for quick checks in a shell.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from pool import env_bool
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+DB_QUERY_HEADERS = env_bool("DB_QUERY_HEADERS", True)
+
+# contadores abiertos con count_queries(), por hilo
+_counters = threading.local()
+
+
+class QueryCount:
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = []
+        # los parametros de cada sentencia, para repetirla (EXPLAIN en scripts/check_query_plans.py)
+        self.parameters = []
+
+    def __repr__(self):
+        return "<QueryCount %d queries %.1fms>" % (self.count, self.time * 1000)
+
+
+def route_of_request():
+    if not has_request_context():
+        return "-"
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    return "%s %s" % (request.method, rule)
+
+
+def record_query(statement, elapsed, parameters=None):
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + elapsed
+    for counter in getattr(_counters, "stack", ()):
+        counter.count += 1
+        counter.time += elapsed
+        counter.statements.append(statement)
+        counter.parameters.append(parameters)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("slow query %.1fms in %s: %s", elapsed * 1000, route_of_request(), " ".join(statement.split()))
+
+
+def instrument_engine(engine):
+    """Counts and times every statement of engine (the slow query log, count_queries())"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        record_query(statement, time.perf_counter() - conn.info["query_start"].pop(), parameters)
+
+    @event.listens_for(engine, "handle_error")
+    def failed_query(context):
+        # una sentencia que falla no llega a after_cursor_execute
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            record_query(context.statement or "", time.perf_counter() - starts.pop(), context.parameters)
+
+
+def setup_query_stats(app, engine):
+    instrument_engine(engine)
+    if not DB_QUERY_HEADERS:
+        return
+
+    @app.after_request
+    def add_query_headers(response):
+        # en las respuestas en streaming solo cuentan las consultas hechas
+        # antes de enviar las cabeceras
+        response.headers["X-DB-Queries"] = str(g.get("db_queries", 0))
+        response.headers["X-DB-Time"] = "%.2f" % (g.get("db_time", 0.0) * 1000)
+        return response
+
+
+@contextmanager
+def count_queries():
+    """Counts the statements run by this thread inside the block.
+
+        with count_queries() as queries:
+            client.get("/patients")
+        print(queries.count, queries.statements)
+    """
+    counter = QueryCount()
+    stack = getattr(_counters, "stack", None)
+    if stack is None:
+        stack = _counters.stack = []
+    stack.append(counter)
+    try:
+        yield counter
+    finally:
+        stack.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(maximum, label="block"):
+    """Raises AssertionError if the block runs more than maximum statements."""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > maximum:
+        raise AssertionError("%s ran %d queries, budget is %d:\n  %s" % (
+            label, counter.count, maximum, "\n  ".join(" ".join(s.split()) for s in counter.statements)))
@@ -0,0 +1,82 @@
+"""
+Payment reports, aggregated in the database from the PayDaily rollup (see rollup.py)
+"""
+from models import db, PayDaily
+from utils import APIException, parse_date
+
+PAY_METHODS = ["pesos", "cash", "pay_mov", "biopago", "point"]
+SUMMARY_GROUPS = ["day", "week", "month"]
+
+
+def period_expression(column, group, dialect):
+    """First day of the day/week/month of a date column, weeks start on monday"""
+    if group == "day":
+        return column
+    if dialect == "postgresql":
+        return db.cast(db.func.date_trunc(group, column), db.Date)
+    if dialect == "sqlite":
+        if group == "week":
+            return db.func.date(column, "weekday 0", "-6 days")
+        return db.func.strftime("%Y-%m-01", column)
+    if dialect in ("mysql", "mariadb"):
+        if group == "week":
+            return db.func.date_sub(column, db.text("INTERVAL WEEKDAY(%s) DAY" % column))
+        return db.func.date_format(column, "%Y-%m-01")
+    raise APIException("pay summary is not supported on %s" % dialect, status_code=500)
+
+
+def period_key(value):
+    # sqlite devuelve texto y postgres fechas, la respuesta siempre lleva ISO
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)[:10]
+
+
+def empty_totals():
+    # total siempre float, como la columna del rollup, aunque no haya pagos
+    return {method: {"total": 0.0, "count": 0} for method in PAY_METHODS}
+
+
+def summary_response(date_from, date_to, group, rows):
+    """rows: (period, method, total, count), sorted by period"""
+    periods = {}
+    totals = empty_totals()
+    for period, method, total, count in rows:
+        period = period_key(period)
+        if period not in periods:
+            periods[period] = dict(empty_totals(), period=period)
+        total = float(total) if total is not None else 0.0
+        count = count if count is not None else 0
+        periods[period][method] = {"total": total, "count": count}
+        totals[method]["total"] += total
+        totals[method]["count"] += count
+    return {
+        "from": date_from.isoformat() if date_from else None,
+        "to": date_to.isoformat() if date_to else None,
+        "group": group,
+        "periods": list(periods.values()),
+        "totals": totals,
+    }
+
+
+def pay_summary_statement(date_from, date_to, group, dialect):
+    # lee la tabla PayDaily: como mucho dias x metodos filas, no la tabla pay
+    period = period_expression(PayDaily.day, group, dialect).label("period")
+    statement = db.select(period, PayDaily.method, db.func.sum(PayDaily.total), db.func.sum(PayDaily.count))
+    if date_from is not None:
+        statement = statement.where(PayDaily.day >= date_from)
+    if date_to is not None:
+        statement = statement.where(PayDaily.day <= date_to)
+    # los borrados y los cambios de fecha dejan en el rollup filas con count 0:
+    # esos dias ya no tienen pagos de ese metodo
+    return (statement.group_by(period, PayDaily.method).having(db.func.sum(PayDaily.count) > 0)
+            .order_by(period, PayDaily.method))
+
+
+def pay_summary(date_from, date_to, group):
+    group = group or "day"
+    if group not in SUMMARY_GROUPS:
+        raise APIException("group must be one of: %s" % ", ".join(SUMMARY_GROUPS), status_code=400)
+    date_from, date_to = parse_date(date_from, "from"), parse_date(date_to, "to")
+    dialect = db.session.get_bind().dialect.name
+
+    rows = db.session.execute(pay_summary_statement(date_from, date_to, group, dialect)).all()
+    return summary_response(date_from, date_to, group, rows)
@@ -0,0 +1,133 @@
+"""
+Daily payment totals (PayDaily), one row per day and payment method.
+
+The write paths call apply_pays() inside their own transaction: with sign=-1
+before a payment changes or disappears and with sign=1 once it is flushed, so
+the rollup commits or rolls back together with the payments. The sign=-1 read
+locks the payments first, so two concurrent edits of the same payment cannot
+both subtract its old amounts.
+"""
+import datetime
+from models import db, Pay, PayDaily, Record
+from reports import PAY_METHODS
+
+
+def pay_daily_statement(pay_filter=None):
+    """(day, method totals and counts) of the payments matching pay_filter, per record date"""
+    columns = [Record.date.label("day")]
+    for method in PAY_METHODS:
+        amount = getattr(Pay, method)
+        columns.append(db.func.sum(amount).label(method + "_total"))
+        columns.append(db.func.sum(db.case((amount != 0, 1), else_=0)).label(method + "_count"))
+    statement = db.select(*columns).select_from(Pay).join(Record, Record.id == Pay.id_record)
+    if pay_filter is not None:
+        statement = statement.where(pay_filter)
+    return statement.group_by(Record.date)
+
+
+def lock_pays(pay_filter, session):
+    """Locks the payments matching pay_filter and their records until the end
+    of the transaction, so their amounts and dates can be read and changed
+    without another transaction doing the same in between"""
+    if session.get_bind().dialect.name == "sqlite":
+        # sin FOR UPDATE; pysqlite ademas lee fuera de transaccion hasta la primera
+        # escritura. Una escritura vacia abre la transaccion con el bloqueo de escritura
+        # de la base, y las demas esperan a que termine para leer y restar. La clave
+        # no existe (no hay metodo ""), la busqueda por la clave primaria no encuentra nada
+        session.execute(db.update(PayDaily).where(PayDaily.day == datetime.date.min, PayDaily.method == "")
+                        .values(count=PayDaily.count))
+        return
+    # sin OF: bloquea las filas de pay y las de record (la fecha decide el dia)
+    session.execute(db.select(Pay.id).join(Record, Record.id == Pay.id_record).where(pay_filter).with_for_update())
+
+
+def daily_rows(pay_filter=None, session=None, locked=False):
+    session = session if session is not None else db.session
+    statement = pay_daily_statement(pay_filter)
+    if locked and session.get_bind().dialect.name == "mysql":
+        # en REPEATABLE READ una lectura normal ve la foto del inicio de la
+        # transaccion, solo una lectura con bloqueo ve el ultimo valor
+        statement = statement.with_for_update()
+    rows = []
+    for row in session.execute(statement):
+        for method in PAY_METHODS:
+            count = row._mapping[method + "_count"] or 0
+            if count:
+                rows.append({"day": row.day, "method": method,
+                             "total": row._mapping[method + "_total"] or 0, "count": count})
+    return rows
+
+
+def upsert_statement(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    statement = insert(PayDaily)
+    return statement.on_conflict_do_update(
+        index_elements=[PayDaily.day, PayDaily.method],
+        set_={
+            "total": PayDaily.total + statement.excluded.total,
+            "count": PayDaily.count + statement.excluded.count,
+        },
+    )
+
+
+def add_to_rollup(rows, session=None):
+    """Adds each (day, method, total, count) row to the rollup with one upsert"""
+    if not rows:
+        return
+    session = session if session is not None else db.session
+    statement = upsert_statement(session.get_bind().dialect.name)
+    if statement is not None:
+        session.execute(statement, rows)
+        return
+    # sin ON CONFLICT (mysql) fila a fila, bloqueando la fila existente
+    for row in rows:
+        current = session.execute(
+            db.select(PayDaily).filter_by(day=row["day"], method=row["method"]).with_for_update()
+        ).scalar_one_or_none()
+        if current is None:
+            session.add(PayDaily(**row))
+        else:
+            current.total += row["total"]
+            current.count += row["count"]
+    session.flush()
+
+
+def apply_pays(pay_filter, sign, session=None):
+    """Adds (sign=1) or subtracts (sign=-1) the payments matching pay_filter,
+    in `session` (the Flask-SQLAlchemy one by default)"""
+    session = session if session is not None else db.session
+    if sign < 0:
+        lock_pays(pay_filter, session)
+    rows = daily_rows(pay_filter, session, locked=sign < 0)
+    for row in rows:
+        row["total"] *= sign
+        row["count"] *= sign
+    add_to_rollup(rows, session)
+
+
+def rebuild():
+    """Recomputes the whole rollup from the pay table, returns the number of rows"""
+    db.session.execute(db.delete(PayDaily))
+    rows = daily_rows()
+    add_to_rollup(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def verify(tolerance=0.01):
+    """Differences between the rollup and the pay table, as (day, method, expected, stored)"""
+    expected = {(row["day"], row["method"]): (row["total"], row["count"]) for row in daily_rows()}
+    stored = {(row.day, row.method): (row.total, row.count)
+              for row in db.session.execute(db.select(PayDaily)).scalars()}
+    differences = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, (0, 0))
+        have = stored.get(key, (0, 0))
+        if abs(want[0] - have[0]) > tolerance or want[1] != have[1]:
+            differences.append((key[0], key[1], want, have))
+    return differences
@@ -0,0 +1,140 @@
+"""
+Text search over patients and clinical records, backed by FTS5 on SQLite and by
+pg_trgm / tsvector indexes on Postgres. The indexes and triggers that keep them
+up to date are created by the migrations.
+"""
+import re
+from models import db, Patient, Record
+from utils import APIException, parse_date
+
+# trigram indexes cannot match anything shorter than this
+MIN_TERM_LENGTH = 3
+
+# tiene que ser la misma expresion que el indice ix_patient_search_trgm
+PATIENT_SEARCH_EXPRESSION = "(patient.name || ' ' || patient.last_name || ' ' || patient.dni)"
+
+
+# columnas de texto de Record que entran en el indice record_fts / search_vector
+RECORD_SEARCH_COLUMNS = ["diagnosis", "recommendations", "treatment", "diagnosis_diff", "diagnosis_eco", "exams",
+                         "medications", "symtomps", "phy_exa", "signs", "type_pat", "observations"]
+
+
+def search_terms(q, min_length=MIN_TERM_LENGTH):
+    terms = [term for term in (q or "").split() if len(term) >= min_length]
+    if not terms:
+        raise APIException("q must contain a term of at least %d characters" % min_length, status_code=400)
+    return terms
+
+
+def fts_match(terms):
+    # cada termino como frase entre comillas, FTS5 los combina con AND
+    return " ".join('"%s"' % term.replace('"', '""') for term in terms)
+
+
+def like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + escaped + "%"
+
+
+def patient_search_statement(q, limit, offset, dialect):
+    """Select for the best ranked patients matching every term of q (prefix or partial)"""
+    terms = search_terms(q)
+
+    if dialect == "sqlite":
+        return db.select(Patient).from_statement(
+            db.text(
+                "SELECT patient.* FROM patient_fts JOIN patient ON patient.id = patient_fts.rowid "
+                "WHERE patient_fts MATCH :match "
+                "ORDER BY bm25(patient_fts), patient.id LIMIT :limit OFFSET :offset"
+            ).bindparams(match=fts_match(terms), limit=limit, offset=offset)
+        )
+
+    expression = db.literal_column(PATIENT_SEARCH_EXPRESSION)
+    if dialect == "postgresql":
+        operator, rank = expression.ilike, db.func.similarity(expression, q).desc()
+    else:
+        # sin indice de texto, al menos el resultado es el mismo
+        operator, rank = expression.like, Patient.id
+    statement = db.select(Patient)
+    for term in terms:
+        statement = statement.where(operator(like_pattern(term), escape="\\"))
+    return statement.order_by(rank, Patient.id).limit(limit).offset(offset)
+
+
+def search_patients(q, limit, offset):
+    dialect = db.session.get_bind().dialect.name
+    return db.session.execute(patient_search_statement(q, limit, offset, dialect)).scalars().all()
+
+
+def record_search_fields(fields):
+    """The columns of ?in= (a comma separated list), all of them by default"""
+    if not fields:
+        return RECORD_SEARCH_COLUMNS
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in RECORD_SEARCH_COLUMNS]
+    if unknown:
+        raise APIException("unknown search columns: %s" % ", ".join(unknown), status_code=400)
+    return fields
+
+
+def record_search_statement(q, fields, date_from, date_to, limit, offset, dialect):
+    """Select for records whose text matches every term of q as a word prefix,
+    only in the given fields, with Record.date between date_from and date_to"""
+    terms = search_terms(q, min_length=1)
+
+    if dialect == "sqlite":
+        conditions = ["record_fts MATCH :match"]
+        params = {
+            # {col1 col2} : limita la busqueda a esas columnas
+            "match": "{%s} : (%s)" % (" ".join(fields), " ".join('"%s"*' % term.replace('"', '""') for term in terms)),
+            "limit": limit,
+            "offset": offset,
+        }
+        if date_from is not None:
+            conditions.append("record.date >= :date_from")
+            params["date_from"] = date_from
+        if date_to is not None:
+            conditions.append("record.date <= :date_to")
+            params["date_to"] = date_to
+        return db.select(Record).from_statement(
+            db.text(
+                "SELECT record.* FROM record_fts JOIN record ON record.id = record_fts.rowid "
+                "WHERE " + " AND ".join(conditions) + " "
+                "ORDER BY bm25(record_fts), record.id LIMIT :limit OFFSET :offset"
+            ).bindparams(**params)
+        )
+
+    statement = db.select(Record)
+    if dialect == "postgresql":
+        words = [re.sub(r"[^\w]", "", term) for term in terms]
+        words = [word for word in words if word]
+        if not words:
+            raise APIException("q must contain letters or numbers", status_code=400)
+        query = db.func.to_tsquery("simple", " & ".join(word + ":*" for word in words))
+        search_vector = db.literal_column("record.search_vector")
+        # el indice GIN da los candidatos, luego se comprueba solo en los campos pedidos
+        statement = statement.where(search_vector.op("@@")(query))
+        if fields != RECORD_SEARCH_COLUMNS:
+            statement = statement.where(db.or_(*[
+                db.func.to_tsvector("simple", db.func.coalesce(getattr(Record, field), "")).op("@@")(query)
+                for field in fields
+            ]))
+        rank = db.func.ts_rank(search_vector, query).desc()
+    else:
+        for term in terms:
+            pattern = like_pattern(term)
+            statement = statement.where(db.or_(*[getattr(Record, field).like(pattern, escape="\\") for field in fields]))
+        rank = Record.id
+    if date_from is not None:
+        statement = statement.where(Record.date >= date_from)
+    if date_to is not None:
+        statement = statement.where(Record.date <= date_to)
+    return statement.order_by(rank, Record.id).limit(limit).offset(offset)
+
+
+def search_records(q, columns, date_from, date_to, limit, offset):
+    dialect = db.session.get_bind().dialect.name
+    statement = record_search_statement(
+        q, record_search_fields(columns), parse_date(date_from, "from"), parse_date(date_to, "to"), limit, offset, dialect
+    )
+    return db.session.execute(statement).scalars().all()
@@ -0,0 +1,233 @@
+"""
+Deterministic synthetic clinic data for load tests: patients with their
+records, payments and obstetric records, with text close to the 1000
+character columns.
+
+The data is cut in chunks of CHUNK_RECORDS records. Each chunk has its own
+random generator (seeded with the seed and the chunk number) and its own id
+range, so the same seed and size give the same rows whatever the number of
+worker processes. Ids are dense in every table: the main process counts the
+obstetric records of each chunk beforehand to know where its ids start. Chunks are generated in parallel; on postgres every worker
+writes its chunk with COPY, elsewhere the workers generate and the main
+process writes with executemany.
+"""
+import csv
+import datetime
+import io
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from models import db, Patient, Record, Record_Obst, Pay
+import rollup
+
+RECORDS_PER_PATIENT = 10
+OBSTETRIC_SHARE = 0.3
+CHUNK_RECORDS = 10000
+FIRST_DAY = datetime.date(2023, 1, 1)
+DAYS = 730
+TEXT_LENGTH = 1000
+
+WORDS = ("dolor", "fiebre", "control", "tension", "abdominal", "cefalea", "reposo", "hidratacion", "ecografia",
+         "hemograma", "glicemia", "paracetamol", "ibuprofeno", "amoxicilina", "normal", "leve", "cronico",
+         "agudo", "seguimiento", "embarazo", "semanas", "alergia", "presion", "arterial", "consulta", "paciente",
+         "refiere", "evolucion", "favorable", "diabetes", "hipertension", "antecedentes", "cada", "horas", "dias",
+         "sin", "con", "de", "la", "el", "y", "en", "por")
+NAMES = ("Maria", "Jose", "Ana", "Luis", "Carmen", "Pedro", "Rosa", "Carlos", "Elena", "Miguel", "Laura", "Jorge")
+LAST_NAMES = ("Perez", "Gonzalez", "Rodriguez", "Hernandez", "Garcia", "Martinez", "Lopez", "Diaz", "Torres")
+CITIES = ("Caracas", "Maracaibo", "Valencia", "Barquisimeto", "Merida", "Cumana")
+PATIENT_TYPES = ("general", "obstetric", "pediatric")
+
+# los textos largos son trozos de un corpus fijo: mucho mas rapido que unir
+# palabras una a una y sigue siendo texto que se puede buscar
+_corpus_rng = random.Random(0)
+CORPUS = " ".join(_corpus_rng.choice(WORDS) for i in range(40000))
+
+PATIENT_COLUMNS = ("id", "name", "last_name", "dni", "parish", "city", "mun", "date", "gender", "number",
+                   "ant_fam", "ant_per", "updated_at")
+RECORD_TEXT_COLUMNS = ("diagnosis", "recommendations", "treatment", "diagnosis_diff", "diagnosis_eco", "exams",
+                       "medications", "symtomps", "phy_exa", "signs", "observations")
+RECORD_COLUMNS = ("id", "date", "type_pat", "id_patient", "updated_at") + RECORD_TEXT_COLUMNS
+PAY_COLUMNS = ("id", "pesos", "cash", "pay_mov", "biopago", "point", "id_record", "updated_at")
+OBSTETRIC_COLUMNS = ("id", "num_births", "num_abort", "menst_date", "type_preg", "id_record", "updated_at")
+
+# en orden de insercion, los padres primero
+TABLES = (
+    (Patient.__tablename__, PATIENT_COLUMNS),
+    (Record.__tablename__, RECORD_COLUMNS),
+    (Pay.__tablename__, PAY_COLUMNS),
+    (Record_Obst.__tablename__, OBSTETRIC_COLUMNS),
+)
+
+
+def text(rng, length=TEXT_LENGTH):
+    size = rng.randint(length // 2, length)
+    start = rng.randrange(len(CORPUS) - size)
+    return CORPUS[start:start + size].strip()
+
+
+def chunk_range(chunk, records):
+    first = chunk * CHUNK_RECORDS
+    return range(first, min(first + CHUNK_RECORDS, records))
+
+
+def obstetric_flags(seed, chunk, records):
+    """Which records of the chunk have an obstetric record"""
+    # generador aparte: el proceso principal los cuenta sin generar el trozo
+    rng = random.Random("%s-%s-obstetric" % (seed, chunk))
+    return [rng.random() < OBSTETRIC_SHARE for n in chunk_range(chunk, records)]
+
+
+def chunk_first_ids(seed, chunks, records, first_ids):
+    """First ids of every chunk. Patients, records and pays have a fixed
+    number of rows per record, obstetric records continue where the
+    previous chunk left them."""
+    patient_base, record_base, pay_base, obstetric_id = first_ids
+    result = []
+    for chunk in chunks:
+        result.append((patient_base, record_base, pay_base, obstetric_id))
+        obstetric_id += sum(obstetric_flags(seed, chunk, records))
+    return result
+
+
+def chunk_rows(seed, chunk, records, first_ids, updated_at):
+    """Rows of one chunk as {table: [tuple, ...]} in the column order of TABLES.
+
+    Record n (counting from 0) belongs to patient n // RECORDS_PER_PATIENT
+    and its pay takes the same offset n. Obstetric records are numbered in
+    order from the chunk's own first id (see chunk_first_ids)."""
+    rng = random.Random("%s-%s" % (seed, chunk))
+    patient_base, record_base, pay_base, obstetric_id = first_ids
+    flags = obstetric_flags(seed, chunk, records)
+    rows = {table: [] for table, columns in TABLES}
+    patient_rows, record_rows, pay_rows, obstetric_rows = (rows[table] for table, columns in TABLES)
+
+    for n, obstetric in zip(chunk_range(chunk, records), flags):
+        patient = n // RECORDS_PER_PATIENT
+        if n % RECORDS_PER_PATIENT == 0:
+            id = patient_base + patient
+            patient_rows.append((
+                id, rng.choice(NAMES), rng.choice(LAST_NAMES), "S%08d" % id, rng.choice(CITIES),
+                rng.choice(CITIES), rng.choice(CITIES), FIRST_DAY - datetime.timedelta(days=rng.randrange(365 * 80)),
+                rng.choice(("F", "M")), "04%09d" % rng.randrange(10 ** 9), text(rng), text(rng), updated_at,
+            ))
+        date = FIRST_DAY + datetime.timedelta(days=rng.randrange(DAYS))
+        record_rows.append((record_base + n, date, rng.choice(PATIENT_TYPES), patient_base + patient, updated_at)
+                           + tuple(text(rng) for column in RECORD_TEXT_COLUMNS))
+        pay_rows.append((pay_base + n, rng.randrange(0, 50000), rng.randrange(0, 100), round(rng.uniform(0, 500), 2),
+                         round(rng.uniform(0, 100), 2), round(rng.uniform(0, 300), 2), record_base + n, updated_at))
+        if obstetric:
+            obstetric_rows.append((obstetric_id, rng.randrange(0, 5), rng.randrange(0, 3),
+                                   date - datetime.timedelta(days=rng.randrange(20, 280)),
+                                   rng.choice(("simple", "gemelar")), record_base + n, updated_at))
+            obstetric_id += 1
+    return rows
+
+
+def copy_rows(connection, rows):
+    # COPY de postgres (psycopg2), una tabla tras otra en la misma transaccion
+    cursor = connection.cursor()
+    for table, columns in TABLES:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows[table])
+        buffer.seek(0)
+        cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (table, ", ".join(columns)), buffer)
+    connection.commit()
+
+
+def insert_rows(connection, rows, placeholder):
+    cursor = connection.cursor()
+    for table, columns in TABLES:
+        if rows[table]:
+            cursor.executemany("INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns),
+                                                                    ", ".join([placeholder] * len(columns))),
+                               rows[table])
+    connection.commit()
+
+
+def copy_chunk(database_url, seed, chunk, records, first_ids, updated_at):
+    """Worker: generates one chunk and writes it with its own connection (postgres)"""
+    import psycopg2
+    rows = chunk_rows(seed, chunk, records, first_ids, updated_at)
+    connection = psycopg2.connect(database_url)
+    try:
+        copy_rows(connection, rows)
+    finally:
+        connection.close()
+    return {table: len(rows[table]) for table, columns in TABLES}
+
+
+def next_id(model):
+    return (db.session.scalar(db.select(db.func.max(model.id))) or 0) + 1
+
+
+def reset_sequences():
+    # en postgres los ids explicitos no avanzan las secuencias serial
+    if db.engine.dialect.name != "postgresql":
+        return
+    for model in (Patient, Record, Pay, Record_Obst):
+        table = model.__tablename__
+        db.session.execute(db.text("SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                                   "(SELECT coalesce(max(id), 1) FROM \"%s\"))" % table), {"table": table})
+    db.session.commit()
+
+
+def seed_database(records, seed=0, workers=1, on_chunk=None):
+    """Adds `records` records (with their patients, pays and obstetric records)
+    after the rows already in the database, using `workers` processes.
+    on_chunk(counts) is called with the running totals after every chunk.
+    Returns the number of rows written per table."""
+    first_ids = (next_id(Patient), next_id(Record), next_id(Pay), next_id(Record_Obst))
+    db.session.commit()
+    updated_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+    chunks = range((records + CHUNK_RECORDS - 1) // CHUNK_RECORDS)
+    chunk_ids = chunk_first_ids(seed, chunks, records, first_ids)
+    counts = {table: 0 for table, columns in TABLES}
+    engine = db.engine
+    postgres = engine.dialect.name == "postgresql"
+
+    def add(chunk_counts):
+        for table in counts:
+            counts[table] += chunk_counts[table]
+        if on_chunk is not None:
+            on_chunk(dict(counts))
+
+    if not postgres:
+        # con un solo escritor basta un proceso generando el siguiente trozo
+        # mientras este escribe el actual
+        workers = min(workers, 2)
+    # spawn, como en passwords.py: los hijos no heredan conexiones abiertas
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        if postgres:
+            url = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+            arguments = [(url, seed, chunk, records, chunk_ids[chunk], updated_at) for chunk in chunks]
+            if executor is None:
+                results = (copy_chunk(*item) for item in arguments)
+            else:
+                results = executor.map(copy_chunk, *zip(*arguments)) if arguments else []
+            for chunk_counts in results:
+                add(chunk_counts)
+        else:
+            placeholder = "%s" if engine.dialect.dbapi.paramstyle in ("format", "pyformat") else "?"
+            arguments = [(seed, chunk, records, chunk_ids[chunk], updated_at) for chunk in chunks]
+            if executor is None:
+                results = (chunk_rows(*item) for item in arguments)
+            else:
+                results = executor.map(chunk_rows, *zip(*arguments)) if arguments else []
+            connection = engine.raw_connection()
+            try:
+                for rows in results:
+                    insert_rows(connection, rows, placeholder)
+                    add({table: len(rows[table]) for table in counts})
+            finally:
+                connection.close()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    reset_sequences()
+    # el resumen diario de pagos se recalcula de una vez
+    rollup.rebuild()
+    return counts
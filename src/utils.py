@@ -1,4 +1,12 @@
-from flask import jsonify, url_for
+import base64
+import datetime
+from sqlalchemy import func
+from flask import Response, jsonify, url_for, request
+from werkzeug.http import parse_etags, parse_date as parse_date_header
+
+# tamaño de pagina por defecto y maximo para los endpoints de listado
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +23,157 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(value):
+    # el cursor es opaco para el cliente, solo codificamos el ultimo id visto
+    return base64.urlsafe_b64encode(str(value).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise APIException("invalid cursor", status_code=400)
+
+def get_page_args():
+    """Reads ?limit= and ?after= from the request, returns (limit, after_id)"""
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise APIException("limit must be an integer", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    after = request.args.get("after", None)
+    if after is not None:
+        after = decode_cursor(after)
+    return limit, after
+
+def page_window(query, column):
+    """The rows of the requested page, plus one to know if there is another page"""
+    limit, after = get_page_args()
+    if after is not None:
+        query = query.filter(column > after)
+    return query.order_by(column).limit(limit + 1), limit
+
+def paginate(query, column):
+    """Keyset pagination over a unique, indexed column (usually the primary key).
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    window, limit = page_window(query, column)
+    items = window.all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(getattr(items[-1], column.key))
+    return items, next_cursor
+
+def page_response(body, next_cursor, status_code=200):
+    # el cursor va siempre en la cabecera, y tambien en el cuerpo cuando es un objeto
+    if isinstance(body, dict):
+        body["next"] = next_cursor
+    response = jsonify(body)
+    response.status_code = status_code
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+def parse_date(value, name):
+    if value is None:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise APIException("%s must be a date like 2024-09-21" % name, status_code=400)
+
+def make_etag(*parts):
+    # partes de la version (nombre, id, updated_at, ...) unidas en un valor opaco
+    values = []
+    for part in parts:
+        if isinstance(part, datetime.datetime):
+            part = int(part.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000000)
+        values.append(str(part))
+    return encode_cursor("-".join(values))
+
+def parse_fields(model, value):
+    """The serialize() keys asked for in ?fields= (a comma separated list, or
+    "all"), the model's summary by default. The id is always included."""
+    if value is None:
+        return model.summary_keys
+    if value.strip() == "all":
+        return model.serialize_keys
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in model.serialize_keys]
+    if unknown:
+        raise APIException("unknown fields: %s" % ", ".join(unknown), status_code=400)
+    return tuple(key for key in model.serialize_keys if key == "id" or key in fields)
+
+def parse_ids(value, limit):
+    """The ids of a comma separated ?ids= list or of a JSON list, sorted and without repeats"""
+    if value is None or isinstance(value, str):
+        value = [id for id in (value or "").split(",") if id.strip()]
+    elif not isinstance(value, list) or any(isinstance(id, (bool, float)) for id in value):
+        raise APIException("ids must be a list of integers", status_code=400)
+    try:
+        ids = sorted({int(id) for id in value})
+    except (TypeError, ValueError):
+        raise APIException("ids must be a comma separated list of integers", status_code=400)
+    if not ids:
+        raise APIException("ids is required", status_code=400)
+    if len(ids) > limit:
+        raise APIException("at most %d ids per request" % limit, status_code=400)
+    return ids
+
+def get_fields(model):
+    return parse_fields(model, request.args.get("fields", None))
+
+def query_version(query, column, updated_at, *parts):
+    """The etag of the rows a query returns, without loading them.
+
+    count + max(id) + max(updated_at) changes on any insert, update or delete.
+    Extra parts (like the fields sent) also go into the etag. There is no
+    Last-Modified for collections: max(updated_at) stays the same when a row
+    is deleted, so If-Modified-Since would answer 304 with a stale list.
+    """
+    rows = query.with_entities(column.label("id"), updated_at.label("updated_at")).subquery()
+    count, max_id, max_updated_at = query.session.query(
+        func.count(), func.max(rows.c.id), func.max(rows.c.updated_at)
+    ).one()
+    return make_etag(count, max_id, max_updated_at, *parts)
+
+def http_last_modified(updated_at):
+    if updated_at is None:
+        return None
+    # la cabecera solo tiene segundos
+    return updated_at.replace(tzinfo=datetime.timezone.utc, microsecond=0)
+
+def is_not_modified(etag, last_modified=None):
+    """Checks If-None-Match, or If-Modified-Since when there is no If-None-Match"""
+    return validators_match(etag, last_modified, request.headers.get("If-None-Match"),
+                            request.headers.get("If-Modified-Since"))
+
+def validators_match(etag, last_modified, if_none_match, if_modified_since):
+    # recibe las cabeceras como texto, asi sirve tambien fuera de Flask (asgi.py)
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag)
+    since = parse_date_header(if_modified_since) if if_modified_since else None
+    if last_modified is not None and since is not None:
+        return last_modified <= since
+    return False
+
+def not_modified_response(etag, last_modified=None):
+    response = Response(status=304)
+    return add_validators(response, etag, last_modified)
+
+def add_validators(response, etag, last_modified=None):
+    # debil: el mismo etag vale para el cuerpo comprimido y sin comprimir
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
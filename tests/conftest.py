@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from _app import load_app, seed  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def api():
+    """src/app.py on a migrated temporary SQLite database, seeded once for every test"""
+    # app.py solo se importa una vez por proceso, con una sola base
+    app = load_app().api
+    with app.app_context():
+        seed(patients=10, records=2)
+        import rollup
+        rollup.rebuild()
+    return app
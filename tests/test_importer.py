@@ -0,0 +1,37 @@
+"""
+A visit row with a pay is imported whole or not at all
+"""
+import io
+
+HEADER = ("dni,date,diagnosis,recommendations,treatment,diagnosis_diff,diagnosis_eco,exams,medications,symtomps,"
+          "phy_exa,signs,type_pat,observations,pesos,cash,pay_mov,biopago,point\n")
+VISIT = "%s,2024-05-01,fiebre,reposo,paracetamol,-,-,-,-,-,-,-,general,-,"
+
+
+def counts(api):
+    from models import db, Pay, Record
+    with api.app_context():
+        return (db.session.scalar(db.select(db.func.count()).select_from(Record)),
+                db.session.scalar(db.select(db.func.count()).select_from(Pay)))
+
+
+def upload(api, body):
+    data = {"file": (io.BytesIO(body.encode()), "visits.csv")}
+    return api.test_client().post("/import/records", data=data, content_type="multipart/form-data").get_json()
+
+
+def test_invalid_pay_rejects_the_visit(api):
+    before = counts(api)
+    # pesos sin cash: el pago no es valido
+    stats = upload(api, HEADER + VISIT % "P0000008" + "10,,,,\n")
+    assert (stats["created"], stats["failed"], stats["pays"]) == (0, 1, 0)
+    assert stats["errors"][0]["line"] == 2
+    assert stats["errors"][0]["error"].startswith("pay: ")
+    assert counts(api) == before
+
+
+def test_visit_with_pay(api):
+    records, pays = counts(api)
+    stats = upload(api, HEADER + VISIT % "P0000008" + "10,1,0,0,0\n" + VISIT % "P0000009" + ",,,,\n")
+    assert (stats["created"], stats["failed"], stats["pays"]) == (2, 0, 1)
+    assert counts(api) == (records + 2, pays + 1)
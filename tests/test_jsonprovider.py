@@ -0,0 +1,83 @@
+"""
+OrjsonProvider must write the same bytes as Flask's DefaultJSONProvider
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from jsonprovider import OrjsonProvider, orjson  # noqa: E402
+
+pytestmark = pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+
+CONTROL = "".join(chr(code) for code in range(0x20))
+
+VALUES = [
+    {"a": "x\x7fy"},
+    {"a": "\x7f"},
+    {"control": CONTROL},
+    {"b": CONTROL + "\x7f" + "ñandú"},
+    {"name": "José Núñez", "city": "Logroño"},
+    {"emoji": "\U0001f600", "cjk": "中文", "nbsp": "\xa0", "c1": "\x80\x9f"},
+    {"quotes": "\"\\/", "line": "\u2028\u2029"},
+    {"nested": [{"z": "\x00", "a": ["\x7f", "é", 1, 1.5, None, True]}]},
+    ["\x7f", "\x1f", "ü"],
+    "\x7f",
+]
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.fixture
+def providers(app):
+    return DefaultJSONProvider(app), OrjsonProvider(app)
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_dumps_matches_flask(providers, value):
+    flask_provider, orjson_provider = providers
+    compact = {"separators": (",", ":")}
+    assert orjson_provider.dumps(value, **compact) == flask_provider.dumps(value, **compact)
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_response_matches_flask(app, providers, value):
+    flask_provider, orjson_provider = providers
+    with app.app_context():
+        expected = flask_provider.response(value).get_data()
+        assert orjson_provider.response(value).get_data() == expected
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_dumps_without_ensure_ascii(providers, value):
+    flask_provider, orjson_provider = providers
+    flask_provider.ensure_ascii = orjson_provider.ensure_ascii = False
+    compact = {"separators": (",", ":")}
+    assert orjson_provider.dumps(value, **compact) == flask_provider.dumps(value, **compact)
+
+
+@pytest.mark.parametrize("table", ["patients", "records", "pays"])
+def test_export_matches_flask(api, table, monkeypatch):
+    if not isinstance(api.json, OrjsonProvider):
+        pytest.skip("the app uses Flask's provider (JSON_PROVIDER=flask)")
+    fast_dumps = api.json.fast_dumps
+    calls = []
+
+    def counted_fast_dumps(obj):
+        calls.append(obj)
+        return fast_dumps(obj)
+    monkeypatch.setattr(api.json, "fast_dumps", counted_fast_dumps)
+    body = api.test_client().get("/export/%s.ndjson" % table).get_data()
+    # cada fila exportada se escribe con orjson
+    rows = [obj for obj in calls if "id" in obj]
+    assert rows and len(rows) == body.count(b"\n")
+
+    monkeypatch.setattr(api, "json", DefaultJSONProvider(api))
+    assert body == api.test_client().get("/export/%s.ndjson" % table).get_data()
@@ -0,0 +1,83 @@
+"""
+The daily pay rollup stays equal to the pay table under concurrent edits and
+through the admin views
+"""
+import threading
+import time
+
+import pytest
+
+PAY = {"pesos": 100, "cash": 0, "pay_mov": 0, "biopago": 0, "point": 0}
+
+
+@pytest.fixture
+def verify(api):
+    import rollup
+
+    def run():
+        with api.app_context():
+            return rollup.verify()
+    return run
+
+
+def test_concurrent_edits_of_a_pay(api, verify, monkeypatch):
+    import rollup
+
+    # ensancha la ventana entre leer el pago viejo y escribir el resumen
+    add_to_rollup = rollup.add_to_rollup
+
+    def slow_add_to_rollup(rows, session=None):
+        time.sleep(0.2)
+        add_to_rollup(rows, session)
+    monkeypatch.setattr(rollup, "add_to_rollup", slow_add_to_rollup)
+
+    statuses = []
+    barrier = threading.Barrier(2)
+
+    def edit(pesos):
+        client = api.test_client()
+        barrier.wait()
+        statuses.append(client.put("/pay/1", json=dict(PAY, pesos=pesos)).status_code)
+
+    threads = [threading.Thread(target=edit, args=(pesos,)) for pesos in (200, 300)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200, 200]
+    assert verify() == []
+
+
+def test_admin_writes(api, verify):
+    from models import db, Patient, Pay, Record
+
+    client = api.test_client()
+    with api.app_context():
+        pay = db.session.get(Pay, 2)
+        record_id = pay.id_record
+
+    response = client.post("/admin/pay/edit/?id=2", data=dict(PAY, pesos=555))
+    assert response.status_code == 302
+    with api.app_context():
+        assert db.session.get(Pay, 2).pesos == 555
+    assert verify() == []
+
+    response = client.post("/admin/record/edit/?id=%d" % record_id, data={
+        "date": "2030-01-01", "diagnosis": "d", "recommendations": "r", "treatment": "t", "diagnosis_diff": "d",
+        "diagnosis_eco": "e", "exams": "e", "medications": "m", "symtomps": "s", "phy_exa": "p", "signs": "s",
+        "type_pat": "general", "observations": "o"
+    })
+    assert response.status_code == 302
+    with api.app_context():
+        assert str(db.session.get(Record, record_id).date) == "2030-01-01"
+    assert verify() == []
+
+    for url in ("/admin/pay/delete/", "/admin/record/delete/", "/admin/patient/delete/"):
+        with api.app_context():
+            model = {"pay": Pay, "record": Record}.get(url.split("/")[2])
+            id = db.session.scalar(db.select(model.id)) if model else 2
+        assert client.post(url, data={"id": str(id)}).status_code == 302
+        with api.app_context():
+            assert db.session.get(model or Patient, id) is None
+        assert verify() == []